@@ -1,3 +1,4 @@
+import numpy as np
 import torch
 from torch import nn
 
@@ -23,25 +24,48 @@ class Agent(nn.Module):
         nn.init.zeros_(self.stopping_score_layer.weight.data)
 
     def forward(self, x_seeds, x_nodes, indptr):
+        logits, mask = self.forward_padded(x_seeds, x_nodes, indptr)
+        lengths = mask.sum(1).tolist()
+        # 存储当前样本各个节点log_softmax，社区的value
+        batch_logits = [logits[i, :n] for i, n in enumerate(lengths)]
+        return batch_logits
+
+    def forward_padded(self, x_seeds, x_nodes, indptr):
+        '''
+        按样本分段的批量前向，不再逐样本循环
+        @param x_seeds: 展平后的种子表示
+        @param x_nodes: 展平后的社区表示
+        @param indptr: 每个样本的(start, end, candidate_end)
+        @return: 形状为[bs, max_candidates+1]的对数概率（第n_candidates列为停止动作）以及有效位置的mask
+        '''
         h = self.seed_embedding(x_seeds.unsqueeze(1)) + self.node_embedding(x_nodes.unsqueeze(1))
         h = self.input_mapping(h)
         node_scores = self.node_score_layer(h).squeeze(1)
 
-        batch = []
-        for startpoint, endpoint, candidate_endpoint in indptr:
-            if startpoint == endpoint:
-                raise ValueError('Finished Episode!')
-            else:
-                stop_node = torch.mean(h[startpoint:endpoint], dim=0).unsqueeze(0)
-                # 社区的value
-                node_logits = torch.log_softmax(node_scores[startpoint:candidate_endpoint], 0)  # [r-l]
-                stopping_logits = torch.log_softmax(self.stopping_score_layer(stop_node), 1).squeeze(0)  # [2]
-                logits = torch.cat([node_logits + stopping_logits[0], stopping_logits[1:]], dim=0)  # [*+1]
-                batch.append(logits)           # 存储当前样本各个节点log_softmax，社区的value 添加到 batch 列表中。
-        batch_logits = batch
-        # print(batch_logits)
-        # for logits in batch_logits:
-        #     print(f"type: {type(logits)}")
-        # print(batch)
-        # batch_logits = torch.stack(batch)
-        return batch_logits
\ No newline at end of file
+        # 分段信息在主机端检查并求最大宽度，避免在设备上同步
+        indptr = np.asarray(indptr, dtype=np.int64).reshape(-1, 3)
+        if np.any(indptr[:, 1] == indptr[:, 0]):
+            raise ValueError('Finished Episode!')
+        width = int((indptr[:, 2] - indptr[:, 0]).max()) + 1
+        indptr = torch.as_tensor(indptr, device=h.device)
+        starts, ends, candidate_ends = indptr.unbind(1)
+        seg_lens = ends - starts
+        bs = len(indptr)
+
+        # 社区的value：分段求均值
+        seg_ids = torch.repeat_interleave(torch.arange(bs, device=h.device), seg_lens)
+        stop_node = torch.zeros(bs, h.size(1), dtype=h.dtype, device=h.device).index_add_(0, seg_ids, h)
+        stop_node = stop_node / seg_lens.unsqueeze(1).to(h.dtype)
+        stopping_logits = torch.log_softmax(self.stopping_score_layer(stop_node), 1)  # [bs, 2]
+
+        # 候选节点：补齐后分段log_softmax
+        n_candidates = candidate_ends - starts
+        cols = torch.arange(width, device=h.device).unsqueeze(0)
+        candidate_mask = cols < n_candidates.unsqueeze(1)
+        flat_index = (starts.unsqueeze(1) + cols).clamp(max=len(node_scores) - 1)
+        scores = node_scores[flat_index].masked_fill(~candidate_mask, torch.finfo(node_scores.dtype).min)
+        node_logits = torch.log_softmax(scores, 1) + stopping_logits[:, :1]
+        logits = node_logits.masked_fill(~candidate_mask, float('-inf'))
+        logits = logits.scatter(1, n_candidates.unsqueeze(1), stopping_logits[:, 1:])
+        mask = cols <= n_candidates.unsqueeze(1)
+        return logits, mask
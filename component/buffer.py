@@ -0,0 +1,78 @@
+from typing import List, Union
+
+import numpy as np
+import torch
+
+# 停止动作对应的节点编号
+STOP = -1
+
+
+class RolloutBuffer:
+    '''
+    预先分配的轨迹缓冲区：节点为形状(bs, max_size+1)的int64张量，对数概率为同形状的张量，
+    扩展过程中原地写入，不再逐步创建Python列表
+    '''
+
+    def __init__(self, selected_nodes: List[List[int]], max_size: int):
+        bs = len(selected_nodes)
+        self.bs = bs
+        self.max_size = max_size
+        self.nodes = torch.full((bs, max_size + 1), STOP, dtype=torch.int64)
+        self.lengths = np.array([len(x) for x in selected_nodes], dtype=np.int64)
+        for i, x in enumerate(selected_nodes):
+            self.nodes[i, :len(x)] = torch.as_tensor(x, dtype=torch.int64)
+        # done: 该样本已结束扩展；stopped: 以停止动作结束
+        self.done = torch.zeros(bs, dtype=torch.bool)
+        self.stopped = torch.zeros(bs, dtype=torch.bool)
+        self.n_steps = 0
+        self.logps = None
+        # 共享内存的numpy视图，环境中的下标运算直接使用
+        self._nodes = self.nodes.numpy()
+        self._done = self.done.numpy()
+        self._stopped = self.stopped.numpy()
+
+    @property
+    def valid_index(self) -> np.ndarray:
+        return np.flatnonzero(~self._done)
+
+    def community(self, i: int) -> List[int]:
+        return self._nodes[i, :self.lengths[i]].tolist()
+
+    def add(self, index: np.ndarray, nodes: np.ndarray):
+        '''
+        记录一步中各样本选择的节点，停止动作只标记不写入
+        @param index: 样本下标
+        @param nodes: 选择的节点，STOP表示停止
+        '''
+        stop = nodes == STOP
+        self._stopped[index[stop]] = True
+        self._done[index[stop]] = True
+        index, nodes = index[~stop], nodes[~stop]
+        self._nodes[index, self.lengths[index]] = nodes
+        self.lengths[index] += 1
+
+    def finish(self, index: np.ndarray):
+        self._done[index] = True
+
+    def add_logps(self, index: np.ndarray, logps: torch.Tensor):
+        '''
+        写入一步的对数概率，同一步中所有未结束样本位于同一列
+        @param index: 样本下标
+        @param logps: 对应的对数概率
+        '''
+        if self.logps is None:
+            self.logps = logps.new_zeros((self.bs, self.max_size + 1))
+        self.logps[torch.as_tensor(index, device=logps.device), self.n_steps] = logps
+        self.n_steps += 1
+
+    def padded_logps(self) -> torch.Tensor:
+        '''
+        @return: 形状为[bs, 步数]的对数概率，结束后的位置为0
+        '''
+        return self.logps[:, :self.n_steps]
+
+    def trajectories(self) -> List[List[Union[int, str]]]:
+        '''
+        对外的轨迹格式：节点列表，以停止动作结束的轨迹末尾为'EOS'
+        '''
+        return [self.community(i) + ['EOS'] if self._stopped[i] else self.community(i) for i in range(self.bs)]
@@ -1,10 +1,9 @@
 import copy
 
-import networkx as nx
 import numpy as np
 import torch
 import time
-import random
+from typing import Optional
 
 from openpyxl import Workbook
 
@@ -14,7 +13,8 @@ from grakel import Graph as gGraph
 from grakel.kernels import ShortestPath
 from sklearn.cluster import SpectralClustering
 from component.expander import Expander
-from component.graph import Graph
+from component.sampler import TrainingSampler
+from component.session import DatasetSession
 from utils import wr_file
 from sklearn.cluster import KMeans
 from sklearn_extra.cluster import KMedoids
@@ -25,32 +25,45 @@ from scipy.spatial.distance import squareform
 
 
 
+def select_device(device: str = 'auto', threads: int = 0) -> torch.device:
+    '''
+    选择运行设备：auto表示有GPU时使用cuda:0，否则使用CPU
+    @param device: auto、cpu或cuda:x
+    @param threads: CPU上torch的线程数，0表示保持默认
+    '''
+    if device == 'auto':
+        device = 'cuda:0' if torch.cuda.is_available() else 'cpu'
+    device = torch.device(device)
+    if device.type == 'cpu' and threads > 0 and torch.get_num_threads() != threads:
+        torch.set_num_threads(threads)
+    return device
+
+
 class Detector:
 
-    def __init__(self, args, seed, com_index):
+    def __init__(self, args, seed, com_index, session: Optional[DatasetSession] = None):
         self.args = args
-        # 获取图、已知社区、种子节点
-        self.graph, self.coms = self.loadDataset(args.root, args.dataset)
-        self.oldKnowcoms = self.coms[-args.train_size:]   # 后100
+        # 同一数据集的图、已知社区及其kego子图由session加载一次
+        if session is None:
+            session = DatasetSession(args)
+        self.session = session
+        self.graph, self.coms = session.graph, session.coms
+        self.oldKnowcoms = session.oldKnowcoms
         self.oldSeed = seed
 
-        if args.dataset == "twitter":
-            fileedge = f"datasets/{self.args.dataset}/{self.args.dataset}-1.90.ungraph.txt"
-            G = self.networkx(fileedge)
-            self.oldKnowcoms = self.remove_disconnected_communities(self.oldKnowcoms, G)
-            print("len(communities_copy):", len(self.oldKnowcoms))
-
-        # 获取子图（种子节点的k-ego以及已知社区的k层邻居），给所有节点重新编号，记录映射关系
-        knowcomSeed_nodes = set([node for com in self.coms[-args.train_size:] for node in com] + [seed])   # 后100
-        self.knowcomSeedGraph, self.old_to_new_node_mapping = self.graph.get_k_layer_subgraph_and_mapping(knowcomSeed_nodes, args.k_ego_subG)
-        self.knowcomSeedGraph.setParentGraph(self.graph)
-        # 反转映射以创建新节点ID映射到旧节点ID的字典
-        self.new_to_old_node_mapping = {new_id: old_id for old_id, new_id in self.old_to_new_node_mapping.items()}
+        # 子图在扩展过程中会被修改，每个种子使用一份拷贝，并加入种子节点的kego，新节点的编号接在已有节点之后
+        self.knowcomSeedGraph = session.knowcomGraph.copy()
+        # 生成阶段会动态添加节点，映射仍以字典形式保存
+        new_to_old = session.new_to_old.tolist()
+        self.new_to_old_node_mapping = dict(enumerate(new_to_old))
+        self.old_to_new_node_mapping = dict(zip(new_to_old, range(len(new_to_old))))
+        self.knowcomSeedGraph.add_parent_k_ego([seed], args.k_ego_subG, self.old_to_new_node_mapping,
+                                               self.new_to_old_node_mapping)
         self.args.old_to_new_node_mapping = self.old_to_new_node_mapping
         self.args.new_to_old_node_mapping = self.new_to_old_node_mapping
 
-        # 给节点重新编号，获取新编号后的种子节点，已知社区
-        self.knowcoms = [[self.old_to_new_node_mapping[node] for node in coms] for coms in self.oldKnowcoms]
+        # 已知社区的新编号，获取新编号后的种子节点
+        self.knowcoms = session.knowcoms
         self.args.max_size = max(len(x) for x in self.knowcoms)
         self.train_comms = self.knowcoms
         self.seed = self.old_to_new_node_mapping[seed]
@@ -58,48 +71,13 @@ class Detector:
         # self.computeSimiAndWrite()
 
         # 初始化expander
-        self.device = torch.device('cuda:0')
+        self.device = select_device(args.device, args.threads)
         self.expander = self.init_expander()
-
-    def is_connected_graph(self, graph):
-        return nx.is_connected(graph)
-
-    def remove_disconnected_communities(self, communities, G):
-        connected_communities = []
-        for community in communities:
-            community_graph = G.subgraph(community)
-            if self.is_connected_graph(community_graph):
-                connected_communities.append(community)
-        return connected_communities
-
-    def networkx(self, filename):
-        """--------------------------------------------------------------------------------
-                     function:       把一个含有边的txt数据集表示成networkx
-                     Parameters:     filename：文件名称 .txt格式
-                     Returns：       G：表示成networkx的图
-                    ---------------------------------------------------------------------------------"""
-        fin = open(filename, 'r')
-        G = nx.Graph()
-        for line in fin:
-            data = line.split()
-            if data[0] != '#':
-                G.add_edge(int(data[0]), int(data[1]))
-        return G
-
-    def loadDataset(self, root, dataset):
-        '''
-        加载数据集
-        @param root: 根目录
-        @param dataset: 数据集名称
-        '''
-        with open(f'{root}/{dataset}/{dataset}-1.90.ungraph.txt') as fh:
-            edges = fh.read().strip().split('\n')
-            edges = np.array([[int(i) for i in x.split()] for x in edges])
-        with open(f'{root}/{dataset}/{dataset}-1.90.cmty.txt') as fh:
-            comms = fh.read().strip().split('\n')
-            comms = [[int(i) for i in x.split()] for x in comms]
-        graph = Graph(edges)
-        return graph, comms
+        # 种子的kego已在上面加入子图
+        self.expander.markExpanded([seed])
+        # 训练数据由后台线程预先生成
+        self.sampler = TrainingSampler(self.knowcomSeedGraph, self.train_comms, args.g_batch_size,
+                                       prefetch=args.prefetch)
 
     def init_expander(self):
         '''
@@ -110,7 +88,9 @@ class Detector:
         expander_model = Agent(args.hidden_size).to(device)
         expander_optimizer = optim.Adam(expander_model.parameters(), lr=args.g_lr)
         expander = Expander(args, self.knowcomSeedGraph, expander_model, expander_optimizer, device,
-                      max_size=args.max_size)
+                      max_size=args.max_size, propagation=args.propagation, push_eps=args.push_eps,
+                      conv_cache=args.conv_cache, feature_store=args.feature_store,
+                      rollout_workers=args.rollout_workers)
         return expander
 
     def detect(self):
@@ -128,51 +108,53 @@ class Detector:
                 self.train_expander()
             print('=' * 50)
             print(f'迭代{iter_num}[Test]')
-            if iter_num == 1:
-                pred_com = [[self.seed]]
-            pred_com = self.expander.generateCommunity(pred_com)
-            pred_com = [x[:-1] if x[-1] == 'EOS' else x for x in pred_com]
-            oldID_pred_com = [self.new_to_old_node_mapping[node] for node in pred_com[0]]
+            oldID_pred_com = self.generateCommunities([self.oldSeed])[0]
+            pred_com = [[self.old_to_new_node_mapping[node] for node in oldID_pred_com]]
             if iter_num == 0:
                 if self.args.ablation == 1:
                     # 消融实验
                     wr_file(self.oldSeed, self.com_index, oldID_pred_com, self.args)
                 continue
             res = [self.oldSeed, self.com_index, oldID_pred_com]
+        self.expander.close_workers()
+        self.sampler.close()
         toc = time.time()
         print(f'Elapsed Time: {(toc - tic) // 60} min {(toc - tic) % 60}s')
         return res
 
-    def select_lists(self, matrix, n):
+    def generateCommunities(self, oldSeeds, batch_size=None):
         '''
-        从训练集中随机选择n个社区
-        @param matrix: 训练集
-        @param n: batch
-        @return:
+        用当前模型批量生成多个种子节点的社区，种子的kego先加入子图
+        @param oldSeeds: 原图中的种子节点
+        @param batch_size: 每批同时扩展的种子数
+        @return: 每个种子对应的社区（原图编号）
         '''
-        num_lists = list(range(len(matrix)))
-        while len(num_lists) < n:
-            num_lists = num_lists + num_lists
-        random_indices = np.random.choice(num_lists, size=n, replace=True)
-        selected_lists = [matrix[i] for i in random_indices]
-        return selected_lists
+        batch_size = self.args.infer_batch_size if batch_size is None else batch_size
+        # 已在子图中的种子可能位于已知社区kego的边缘，邻域不完整，因此所有种子都加入其kego；已加入过的会被跳过
+        self.expander.addParentNodes(list(oldSeeds))
+        res = []
+        for start in range(0, len(oldSeeds), batch_size):
+            seeds = [[self.old_to_new_node_mapping[s]] for s in oldSeeds[start:start + batch_size]]
+            coms = self.expander.generateCommunity(seeds)
+            coms = [x[:-1] if x[-1] == 'EOS' else x for x in coms]
+            res.extend([self.new_to_old_node_mapping[node] for node in com] for com in coms)
+        return res
 
     def train_expander(self):
         '''
         训练expander
         '''
-        seeds = []
-        true_coms = self.select_lists(self.train_comms, self.args.g_batch_size)
-        for com in true_coms:
-            seeds.append(random.choice(com))
+        seeds, true_coms, walks = self.sampler.get()
+        if self.args.fused_step:
+            # 强化学习与教师机制合并为一次展开、一次参数更新
+            self.expander.train_step(seeds, true_coms, walks)
+            return
 
         # Reinforcement Learning
         self.expander.trainReward(seeds, true_coms)
 
         # Teacher Forcing
-        true_comms = random.choices(self.train_comms, k=self.args.g_batch_size)
-        true_comms = [self.knowcomSeedGraph.sample_expansion_from_community(x) for x in true_comms]
-        self.expander.train_from_sets(true_comms)
+        self.expander.train_from_sets(walks)
 
 
     def computeSimiAndWrite(self):
@@ -213,11 +195,8 @@ class Detector:
         '''
         communities_copy = copy.deepcopy(self.knowcoms)
         communities_copy.insert(0, com)
-        sp_graph = self.com_trans_graph(communities_copy)  # Ckv是一个二维数组，每一行代表一个已知社区（节点的标号），共10个
-        sp = ShortestPath(normalize=True, with_labels=False)
-        sp.fit_transform(sp_graph)
-        similarity = sp.transform(sp_graph)
-        simi = np.nan_to_num(similarity)
+        # 已知社区之间的最短路径核由session计算一次，这里只计算预测社区所在的一行一列
+        simi = self.session.sp_kernel.similarity(self.knowcomSeedGraph.adj_mat, com)
         traincom = []
         k = self.args.k
         # traincom = self.UsingScSelectCom(simi, communities_copy, 2)
@@ -231,6 +210,7 @@ class Detector:
             traincom = self.UsingCengCiSelectCom(simi, communities_copy, k)
         if len(traincom) != 0:
             self.train_comms = traincom
+            self.sampler.reset(traincom)
         else:
             print("0000000")
 
@@ -242,14 +222,11 @@ class Detector:
                      Returns：       shortest_graph: 已知社区的最短路径图
                      ---------------------------------------------------------------------------------"""
 
-        G = nx.from_numpy_array(self.knowcomSeedGraph.adj_mat)
+        adj_mat = self.knowcomSeedGraph.adj_mat
         shortest_graph = []
         for com in knowcom:
-            edges = G.subgraph(com).edges()
-            G1 = nx.Graph()
-            G1.add_nodes_from(com)
-            G1.add_edges_from(edges)
-            adj = np.array(nx.adjacency_matrix(G1).todense())
+            # 直接从邻接矩阵中切出社区的诱导子图
+            adj = adj_mat[com][:, com].toarray()
             shortest_graph.append(gGraph(adj))
         return shortest_graph
 
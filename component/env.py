@@ -1,7 +1,9 @@
-from typing import Union, Optional, List
+import collections
+from typing import Union, List
 import numpy as np
 from scipy import sparse as sp
 
+from .buffer import RolloutBuffer, STOP
 from .graph import Graph
 
 
@@ -13,20 +15,29 @@ class ExpansionEnv:
         self.n_nodes = self.graph.n_nodes
         self.data = selected_nodes
         self.bs = len(self.data)
-        self.trajectories = None
-        self.dones = None
+        self.buffer = None
+        # 每条轨迹的社区成员集合与边界集合，随step增量维护
+        self.members = None
+        self.boundaries = None
+        # 节点 -> 包含该节点的轨迹下标，新增边时只访问相关的轨迹
+        self.owners = None
+        self._log_pos = 0
+
+    @property
+    def trajectories(self) -> List[List[Union[int, str]]]:
+        return self.buffer.trajectories()
 
     @property
     def lengths(self):
-        return [len(x) - (x[-1] == 'EOS') for x in self.trajectories]
+        return self.buffer.lengths.tolist()
 
     @property
     def done(self):
-        return all(self.dones)
+        return bool(self.buffer.done.all())
 
     @property
-    def valid_index(self) -> List[int]:
-        return [i for i, d in enumerate(self.dones) if not d]
+    def valid_index(self) -> np.ndarray:
+        return self.buffer.valid_index
 
     def __len__(self):
         return len(self.data)
@@ -36,20 +47,42 @@ class ExpansionEnv:
         更新当前图
         @param graph:
         '''
+        edge_log = getattr(graph, 'edge_log', None)
+        if self.boundaries is not None:
+            if graph is self.graph and edge_log is not None and len(edge_log) >= self._log_pos:
+                # 只根据新增边修正包含其端点的轨迹的边界
+                for rows, cols in edge_log[self._log_pos:]:
+                    for u, v in zip(rows.tolist(), cols.tolist()):
+                        for i in self.owners.get(u, ()):
+                            if v not in self.members[i]:
+                                self.boundaries[i].add(v)
+                        for i in self.owners.get(v, ()):
+                            if u not in self.members[i]:
+                                self.boundaries[i].add(u)
+            else:
+                self.boundaries = [graph.outer_boundary(x) for x in self.members]
         self.graph = graph
         self.n_nodes = self.graph.n_nodes
+        self._log_pos = len(edge_log) if edge_log is not None else 0
 
     def reset(self):
         '''
         初始化环境
         '''
         # 这一步初始化环境
-        # self.trajectories是一个二维数组，初始化为种子节点[[1],[2]...]
-        self.trajectories = [x.copy() for x in self.data]
+        # 轨迹保存在预分配的缓冲区中，初始化为种子节点[[1],[2]...]
+        self.buffer = RolloutBuffer(self.data, self.max_size)
+        self.members = [set(x) for x in self.data]
+        self.owners = collections.defaultdict(set)
+        for i, members in enumerate(self.members):
+            for v in members:
+                self.owners[v].add(i)
+        self.boundaries = [self.graph.outer_boundary(x) for x in self.data]
+        edge_log = getattr(self.graph, 'edge_log', None)
+        self._log_pos = len(edge_log) if edge_log is not None else 0
         # 初始化程序对于各个种子节点扩展停止的标志
-        self.dones = [x[-1] == 'EOS' or len(x) >= self.max_size or len(self.graph.outer_boundary(x)) == 0
-                      for x in self.trajectories]
-        assert not any(self.dones)      # 如果所有元素都为False，断言成功，程序继续执行。
+        dones = [len(x) >= self.max_size or len(b) == 0 for x, b in zip(self.data, self.boundaries)]
+        assert not any(dones)      # 如果所有元素都为False，断言成功，程序继续执行。
         # 形式为[1,2,3]的种子节点
         seeds = [self.data[i][0] for i in range(self.bs)]
         # 形式为[[1],[2],[3]], 这里的具体值也是种子节点
@@ -59,27 +92,34 @@ class ExpansionEnv:
         x_nodes = self.make_nodes_encoding(nodes)
         return x_seeds, x_nodes
 
-    def step(self, new_nodes: List[Union[int, str]], index: List[int]):
+    def step(self, new_nodes: np.ndarray, index: np.ndarray):
         '''
         添加新节点到社区，状态转移
-        @param new_nodes: 新添加的节点
-        @param index:
+        @param new_nodes: 新添加的节点，STOP表示停止
+        @param index: 对应的样本下标
         @return: 新节点的初始化表示
         '''
+        new_nodes = np.asarray(new_nodes, dtype=np.int64)
+        index = np.asarray(index, dtype=np.int64)
         assert len(new_nodes) == len(index)
-        full_new_nodes: List[Optional[int]] = [None for _ in range(self.bs)]
-        for i, v in zip(index, new_nodes):
-            self.trajectories[i].append(v)
-            if v == 'EOS':
-                self.dones[i] = True
-            elif len(self.trajectories[i]) == self.max_size:
-                self.dones[i] = True
-            elif self.graph.outer_boundary(self.trajectories[i]) == 0:
-                self.dones[i] = True
+        self.buffer.add(index, new_nodes)
+        added = new_nodes != STOP
+        rows, cols, finished = [], [], []
+        for i, v in zip(index[added].tolist(), new_nodes[added].tolist()):
+            # O(deg(v))地更新成员与边界
+            members, boundary = self.members[i], self.boundaries[i]
+            members.add(v)
+            self.owners[v].add(i)
+            boundary.discard(v)
+            boundary |= self.graph.neighbors[v] - members
+            if self.buffer.lengths[i] == self.max_size or len(boundary) == 0:
+                finished.append(i)
             else:
-                full_new_nodes[i] = v
-        delta_x_nodes = self.make_single_node_encoding(full_new_nodes)
-        return delta_x_nodes
+                rows.append(v)
+                cols.append(i)
+        self.buffer.finish(np.array(finished, dtype=np.int64))
+        data = np.ones(len(rows), dtype=np.float32)
+        return sp.csc_matrix((data, (rows, cols)), shape=[self.n_nodes, self.bs])
 
     def make_single_node_encoding(self, nodes: List[int]):
         '''
@@ -1,18 +1,48 @@
 import copy
+import itertools
+import multiprocessing
 from typing import Union, Optional, List, Set, Dict
 import numpy as np
-from scipy import sparse as sp
 from sklearn.decomposition import TruncatedSVD
 
 import torch
-from torch import nn
 
+from .buffer import RolloutBuffer, STOP
 from .env import ExpansionEnv
 from .graph import Graph
-from .gnn import GraphConv
+from .gnn import GraphConv, PushConv
+from .features import SparseFeatures, DenseFeatures
 from .agent import Agent
 
 
+# 采样进程中的Expander副本（由进程池的initializer传入）
+_ROLLOUT_EXPANDER = None
+
+
+def _init_rollout_worker(expander):
+    global _ROLLOUT_EXPANDER
+    torch.set_num_threads(1)
+    expander.model.to('cpu')
+    expander.device = torch.device('cpu')
+    _ROLLOUT_EXPANDER = expander
+
+
+def _rollout_worker(state_dict, seeds: List[int], rng_seed: int):
+    '''
+    用当前Agent参数的快照采样一批轨迹，不计算梯度；同时返回每一步的模型输入与所选动作，
+    主进程据此直接重算对数概率，不需要再展开环境
+    @return: 轨迹，每一步的(样本下标, vals_seed, vals_node, indptr, 动作)
+    '''
+    expander = _ROLLOUT_EXPANDER
+    torch.manual_seed(rng_seed)
+    expander.model.load_state_dict(state_dict)
+    expander.model.train()
+    steps = []
+    with torch.no_grad():
+        trajectories, _ = expander.sample_bs_trajectories(seeds, record=steps)
+    return trajectories, steps
+
+
 class Expander:
 
     def __init__(self, args, graph: Graph, model: Agent, optimizer,
@@ -20,19 +50,63 @@ class Expander:
                  max_size: int = 25,
                  k: int = 3,
                  alpha: float = 0.85,
-                 gamma: float = 0.99,):
+                 gamma: float = 0.99,
+                 propagation: str = 'matmul',
+                 push_eps: float = 1e-4,
+                 conv_cache: int = 0,
+                 feature_store: str = 'sparse',
+                 rollout_workers: int = 0):
         self.graph = graph
         self.model = model
         self.optimizer = optimizer
         self.n_nodes = self.graph.n_nodes
         self.max_size = max_size
-        self.conv = GraphConv(graph, k, alpha)
+        # matmul: 全图稀疏矩阵乘法；push: 只在种子附近做局部push
+        if propagation == 'push':
+            self.conv = PushConv(graph, k, alpha, push_eps, cache_size=conv_cache)
+        elif propagation == 'matmul':
+            self.conv = GraphConv(graph, k, alpha, cache_size=conv_cache)
+        else:
+            raise NotImplementedError(propagation)
         self.gamma = gamma
         self.args = args
+        # sparse: csc_matrix累加；dense: 复用的float32稠密数组原地累加
+        if feature_store not in ('sparse', 'dense'):
+            raise NotImplementedError(feature_store)
+        self.feature_store = feature_store
+        self._feature_buffers = {}
         if device is None:
             self.device = torch.device('cpu')
         else:
             self.device = device
+        # 大于0时，强化学习的轨迹由多个进程并行采样，主进程只负责重算对数概率并更新参数
+        self.rollout_workers = rollout_workers
+        self._pool = None
+        self._expanded_old_ids = set()
+
+    def _get_pool(self):
+        if self._pool is None:
+            # 训练集采样线程已经启动，fork可能复制被持有的锁，因此用spawn启动采样进程
+            ctx = multiprocessing.get_context('spawn')
+            self._pool = ctx.Pool(self.rollout_workers, initializer=_init_rollout_worker, initargs=(self,))
+        return self._pool
+
+    def close_workers(self):
+        '''
+        关闭采样进程；图发生变化后进程中的副本失效，下次使用时重新创建
+        '''
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def __getstate__(self):
+        # 采样进程不更新参数，也不使用进程池
+        state = self.__dict__.copy()
+        state['_pool'] = None
+        state['optimizer'] = None
+        state['_feature_buffers'] = {}
+        return state
 
 
     def generateCommunity(self, seeds: List[list[int]], max_size: Optional[int] = None):
@@ -50,52 +124,53 @@ class Expander:
             episodes, _ = self._sample_trajectories(env, isTrain)           # episodes中存放模型预测的结果，即trajectories
         return episodes
 
-    def sample_bs_trajectories(self, seeds: List[int], max_size: Optional[int] = None):
+    def sample_bs_trajectories(self, seeds: List[int], max_size: Optional[int] = None,
+                               record: Optional[list] = None):
         '''
         为seeds中结点生成轨迹
         @param seeds:bs个种子节点
         @param max_size:已知社区的最大尺寸
+        @param record:不为None时记录每一步的模型输入与动作
         @return:
         '''
         max_size = self.max_size if max_size is None else max_size
         env = ExpansionEnv(self.graph, [[s] for s in seeds], max_size)
         isTrain = True
-        return self._sample_trajectories(env, isTrain)
+        return self._sample_trajectories(env, isTrain, record)
 
-    def eval_scores(self, pred_comm: Union[List, Set],
-                     true_comm: Union[List, Set]) -> (float, float, float, float):
-        """
-        计算Precision, Recall, F1 and Jaccard
-        @param pred_comm: 预测社区
-        @param true_comm: 真实社区
-        """
-        intersect = set(true_comm) & set(pred_comm)
-        p = len(intersect) / len(pred_comm)
-        r = len(intersect) / len(true_comm)
-        f = 2 * p * r / (p + r + 1e-9)
-        j = len(intersect) / (len(pred_comm) + len(true_comm) - len(intersect))
-        return round(p, 4), round(r, 4), round(f, 4), round(j, 4)
-
-    def tianchong(self, rewards, logps):
+    def compute_rewards(self, trajectories: List[List[Union[int, str]]], true_coms: List[List[int]],
+                        n_steps: int) -> np.ndarray:
         '''
-        将奖励与对数概率对齐，多余位置填0
-        @param rewards: 奖励
-        @param logps: 对数概率
+        整个batch一次性计算奖励：前缀F1由累计命中数得到，每一步的奖励为加入节点前后F1之差，
+        再乘以从该步开始的折扣系数之和（反向累加）
+        @param trajectories: 采样得到的社区（可能以'EOS'结尾）
+        @param true_coms: 对应的真实社区
+        @param n_steps: 对齐到的步数（logps的列数）
+        @return: 形状为[bs, n_steps]的奖励，多余位置为0
         '''
+        bs = len(trajectories)
+        coms = [x[:-1] if x[-1] == 'EOS' else x for x in trajectories]
+        lengths = np.array([len(x) for x in coms])
+        max_len = max(lengths.max(), n_steps + 1)
+        valid = np.arange(max_len)[None, :] < lengths[:, None]
+        nodes = np.zeros((bs, max_len), dtype=np.int64)
+        nodes[valid] = np.concatenate(coms)
 
-        # 找出最大的子列表长度
-        max_len = max(len(sublist) for sublist in rewards)
-
-        # 使用numpy的pad函数在二维数组中添加填充值
-        filled_rewards = np.array([np.pad(sublist, (0, max_len - len(sublist)), 'constant') for sublist in rewards])
+        # 以(样本, 节点)编码判断是否属于对应的真实社区
+        n_nodes = max(self.n_nodes, int(nodes.max()) + 1)
+        true_keys = np.concatenate([i * n_nodes + np.asarray(c, dtype=np.int64) for i, c in enumerate(true_coms)])
+        hits = np.isin(np.arange(bs)[:, None] * n_nodes + nodes, true_keys) & valid
+        intersect = np.cumsum(hits, 1)
+        p = intersect / np.arange(1, max_len + 1)[None, :]
+        r = intersect / np.array([len(c) for c in true_coms])[:, None]
+        f = np.round(2 * p * r / (p + r + 1e-9), 4)
 
-        # 获取logps的行数和列数
-        rows, cols = len(logps), len(logps[0])
-
-        # 使用numpy的pad函数将filled_rewards的形状调整为与logps相同的形状，并在缺失的地方使用零填充
-        filled_rewards = np.pad(filled_rewards, ((0, rows - len(filled_rewards)), (0, cols - filled_rewards.shape[1])),
-                                'constant')
-        return filled_rewards
+        # 第t步加入节点后的F1增益，只对真正加入的节点有效
+        gains = np.where(valid[:, 1:], f[:, 1:] - f[:, :-1], 0.)
+        powers = np.where(valid[:, 1:], self.gamma ** np.arange(max_len - 1)[None, :], 0.)
+        discounts = np.cumsum(powers[:, ::-1], 1)[:, ::-1]
+        rewards = gains * discounts
+        return rewards[:, :n_steps].astype(np.float32)
 
     def trainReward(self, seeds: List[int], true_coms):
         '''
@@ -103,41 +178,111 @@ class Expander:
         @param seeds: 一个batch的节点
         @param true_coms: 节点对应的真是社区
         '''
-        bs = len(seeds)
         self.model.train()
         self.optimizer.zero_grad()
-        selected_nodes, logps = self.sample_bs_trajectories(seeds)
+        if self.rollout_workers > 0:
+            selected_nodes, steps = self.parallel_rollout(seeds)
+            logps = self.replay_logps(steps, len(selected_nodes))
+        else:
+            selected_nodes, logps = self.sample_bs_trajectories(seeds)
 
+        loss = self._reward_loss(selected_nodes, true_coms, logps)
+        loss.backward()
+        self.optimizer.step()
 
-        lengths = torch.LongTensor([len(x) for x in selected_nodes]).to(self.device)
+    def _step_mask(self, trajectories: List[List[Union[int, str]]], n_steps: int) -> torch.Tensor:
+        '''
+        @param trajectories: 轨迹
+        @param n_steps: logps的列数
+        @return: 每条轨迹中参与计算损失的步
+        '''
+        lengths = np.array([len(x) for x in trajectories], dtype=np.int64)
+        mask = np.arange(n_steps)[None, :] < (lengths - 1)[:, None]
+        return torch.from_numpy(mask.astype(np.float32)).to(self.device)
 
+    def _reward_loss(self, trajectories: List[List[Union[int, str]]], true_coms: List[List[int]],
+                     logps: torch.Tensor) -> torch.Tensor:
+        '''
+        强化学习的策略梯度损失
+        @param trajectories: 采样得到的轨迹
+        @param true_coms: 对应的真实社区
+        @param logps: 补齐后的对数概率
+        '''
         # 计算奖励
-        rewards = []
-        for index in range(len(selected_nodes)):
-            com = selected_nodes[index]
-            true_com = true_coms[index]
-            r, gamma = [], 0.99
-            temp_com = [com[0]]
-            for node in com[1:]:
-                if node != 'EOS':
-                    _, _, pre_cost, _ = self.eval_scores(temp_com, true_com)
-                    temp_com.append(node)
-                    _, _, after_cost, _ = self.eval_scores(temp_com, true_com)
-                    r.append(after_cost - pre_cost)
-            reward = [np.sum(r[i] * (gamma ** np.array(range(i, len(r))))) for i in range(len(r))]
-            rewards.append(reward)
-        rewards = self.tianchong(rewards, logps)
-        rewards = torch.from_numpy(rewards).float().to(self.device)
-
-        mask = torch.arange(rewards.size(1), device=self.device,
-                            dtype=torch.int64).expand(bs, -1) < (lengths - 1).unsqueeze(1)
-        mask = mask.float()
-        policy_loss = -(rewards * logps * mask).sum()
-        loss = policy_loss
+        rewards = self.compute_rewards(trajectories, true_coms, logps.size(1))
+        rewards = torch.from_numpy(rewards).to(self.device)
+        mask = self._step_mask(trajectories, rewards.size(1))
+        return -(rewards * logps * mask).sum()
+
+    def _teacher_loss(self, trajectories: List[List[Union[int, str]]], logps: torch.Tensor) -> torch.Tensor:
+        '''
+        教师机制的损失：真实社区轨迹的平均负对数概率
+        @param trajectories: 教师机制得到的轨迹
+        @param logps: 补齐后的对数概率
+        '''
+        mask = self._step_mask(trajectories, logps.size(1))
+        n = mask.sum()
+        return -(1 * logps * mask).sum() / n
+
+    def train_step(self, seeds: List[int], true_coms: List[List[int]], episodes: List[List[int]]):
+        '''
+        强化学习与教师机制共用一个环境同时展开：每步只做一次传播与前向，两部分损失相加后一次反向传播、一次参数更新
+        @param seeds: 强化学习的种子节点
+        @param true_coms: 种子节点对应的真实社区
+        @param episodes: 教师机制的真实社区（walk顺序）
+        '''
+        n_rl = len(seeds)
+        self.model.train()
+        self.optimizer.zero_grad()
+        trajectories, logps = self._mixed_rollout(seeds, episodes)
+        loss = self._reward_loss(trajectories[:n_rl], true_coms, logps[:n_rl]) + \
+            self._teacher_loss(trajectories[n_rl:], logps[n_rl:])
         loss.backward()
         self.optimizer.step()
 
 
+    def parallel_rollout(self, seeds: List[int]):
+        '''
+        将种子分给多个采样进程，各进程用当前参数的快照生成轨迹
+        @param seeds: 一个batch的节点
+        @return: 与seeds顺序一致的轨迹，每一步的(样本下标, 步数, vals_seed, vals_node, indptr, 动作)
+        '''
+        pool = self._get_pool()
+        state_dict = {k: v.detach().cpu() for k, v in self.model.state_dict().items()}
+        chunks = [list(x) for x in np.array_split(np.asarray(seeds), min(self.rollout_workers, len(seeds)))]
+        rng_seeds = np.random.randint(0, 2 ** 31 - 1, size=len(chunks)).tolist()
+        results = pool.starmap(_rollout_worker, [(state_dict, [int(s) for s in chunk], rng_seed)
+                                                 for chunk, rng_seed in zip(chunks, rng_seeds)])
+        trajectories, steps = [], []
+        for chunk_trajectories, chunk_steps in results:
+            # 样本下标换成整个batch中的下标
+            offset = len(trajectories)
+            trajectories.extend(chunk_trajectories)
+            for t, (index, *inputs) in enumerate(chunk_steps):
+                steps.append((index + offset, t, *inputs))
+        return trajectories, steps
+
+    def replay_logps(self, steps, bs: int) -> torch.Tensor:
+        '''
+        把采样进程记录的所有步拼接起来，一次批量前向得到所选动作的对数概率（带梯度）
+        @param steps: parallel_rollout返回的每一步记录
+        @param bs: 样本数
+        @return: 补齐后的对数概率，形状为[bs, 步数]
+        '''
+        index = np.concatenate([x[0] for x in steps])
+        step = np.concatenate([np.full(len(x[0]), x[1], dtype=np.int64) for x in steps])
+        vals_seed = torch.from_numpy(np.concatenate([x[2] for x in steps])).to(self.device)
+        vals_node = torch.from_numpy(np.concatenate([x[3] for x in steps])).to(self.device)
+        # 各步的indptr按该步之前的表示总数平移
+        offsets = np.cumsum([0] + [len(x[2]) for x in steps[:-1]])
+        indptr = np.concatenate([x[4] + offset for x, offset in zip(steps, offsets)])
+        actions = torch.from_numpy(np.concatenate([x[5] for x in steps])).to(self.device)
+        batch_logits, _ = self.model.forward_padded(vals_seed, vals_node, indptr)
+        logps = batch_logits.gather(1, actions.unsqueeze(1)).squeeze(1)
+        padded = logps.new_zeros((bs, int(step.max()) + 1))
+        return padded.index_put((torch.from_numpy(index).to(self.device), torch.from_numpy(step).to(self.device)),
+                                logps)
+
     def train_from_sets(self, episodes: List[List[int]], max_size: Optional[int] = None):
         '''
         教师机制训练
@@ -145,185 +290,220 @@ class Expander:
         @param max_size:
         @return:
         '''
-        max_size = self.max_size if max_size is None else max_size
         self.model.train()
         self.optimizer.zero_grad()
-        env = ExpansionEnv(self.graph, [[x[0]] for x in episodes], max_size)
+        trajectories, logps = self._mixed_rollout([], episodes, max_size)
+        policy_loss = self._teacher_loss(trajectories, logps)
+        policy_loss.backward()
+        self.optimizer.step()
+
+    def _mixed_rollout(self, seeds: List[int], episodes: List[List[int]], max_size: Optional[int] = None):
+        '''
+        在同一个环境中展开：前len(seeds)个样本按策略采样，其余样本按教师机制沿真实社区扩展
+        @param seeds: 采样的种子节点
+        @param episodes: 教师机制的真实社区，以第一个节点为种子
+        @param max_size: 已知社区的最大尺寸
+        @return: 轨迹，补齐后的对数概率
+        '''
+        max_size = self.max_size if max_size is None else max_size
+        n_rl = len(seeds)
+        env = ExpansionEnv(self.graph, [[s] for s in seeds] + [[x[0]] for x in episodes], max_size)
         bs = env.bs
         x_seeds, delta_x_nodes = env.reset()
-        z_seeds = self.conv(x_seeds)
-        z_nodes = sp.csc_matrix((self.n_nodes, bs), dtype=np.float32)
-        episode_logps = [[] for _ in range(bs)]
-        episode_values = [[] for _ in range(bs)]
-        k = 0
+        z_seeds = self._new_features('seeds', bs)
+        z_seeds.add(self.conv(x_seeds))
+        z_nodes = self._new_features('nodes', bs)
+        # remaining[i, v]表示节点v属于目标社区i且尚未加入轨迹
+        remaining = np.zeros((bs, self.graph.n_nodes), dtype=bool)
+        for i, x in enumerate(episodes):
+            remaining[n_rl + i, x[1:]] = True
         while not env.done:
-            k += 1
-            z_nodes += self.conv(delta_x_nodes)
+            z_nodes.add(self.conv(delta_x_nodes))
             valid_index = env.valid_index
-            *model_inputs, batch_candidates = self._prepare_inputs(valid_index, env.trajectories, z_nodes, z_seeds)
-            batch_logits = self.model(*model_inputs)
-            logps = []
-            actions = []
-            for logits, candidates, i in zip(batch_logits, batch_candidates, valid_index):
-                valid_candidates = set(candidates) & (set(episodes[i]) - set(env.trajectories[i]))
-                if len(valid_candidates) == 0:
-                    action = len(candidates)
-                else:
-                    sub_idx = [idx for idx, v in enumerate(candidates) if v in valid_candidates]
-                    action = sub_idx[logits[sub_idx].argmax().item()]       # 选择概率最大的节点加入社区
-                actions.append(action)
-                logps.append(logits[action])
-            new_nodes = [x[i] if i < len(x) else 'EOS' for i, x in zip(actions, batch_candidates)]
+            *model_inputs, batch_candidates = self._prepare_inputs(valid_index, env.buffer, env.boundaries,
+                                                                      z_nodes, z_seeds)
+            batch_logits, batch_mask = self.model.forward_padded(*model_inputs)
+            teacher_mask = self._teacher_mask(remaining, valid_index, batch_candidates, batch_logits.size(1))
+            # 对整个batch做一次masked argmax，选择目标社区中概率最大的候选节点，没有则停止
+            actions = batch_logits.masked_fill(~teacher_mask, float('-inf')).argmax(1)
+            if n_rl > 0:
+                ps = torch.where(batch_mask, torch.exp(batch_logits) + 1e-8, torch.zeros_like(batch_logits))
+                is_rl = torch.as_tensor(valid_index, device=actions.device) < n_rl
+                actions = torch.where(is_rl, torch.multinomial(ps.detach(), 1).squeeze(1), actions)
+            logps = batch_logits.gather(1, actions.unsqueeze(1)).squeeze(1)
+            actions = actions.tolist()
+            new_nodes = np.array([x[i] if i < len(x) else STOP for i, x in zip(actions, batch_candidates)],
+                                 dtype=np.int64)
             delta_x_nodes = env.step(new_nodes, valid_index)
-            for i, v1 in zip(valid_index, logps):
-                episode_logps[i].append(v1)
-        # Stack and Padding
-        logps = nn.utils.rnn.pad_sequence([torch.stack(x) for x in episode_logps], batch_first=True)
-
-        lengths = torch.LongTensor([len(x) for x in env.trajectories]).to(self.device)
-        mask = torch.arange(logps.size(1), device=self.device,
-                            dtype=torch.int64).expand(bs, -1) < (lengths - 1).unsqueeze(1)
-        mask = mask.float()
-        n = mask.sum()
-        policy_loss = -(1 * logps * mask).sum() / n
-        policy_loss.backward()
-        self.optimizer.step()
+            env.buffer.add_logps(valid_index, logps)
+            added = new_nodes != STOP
+            remaining[valid_index[added], new_nodes[added]] = False
+        return env.trajectories, env.buffer.padded_logps()
+
+    def _teacher_mask(self, remaining: np.ndarray, valid_index: np.ndarray, batch_candidates: List[List[int]],
+                      width: int) -> torch.Tensor:
+        '''
+        教师机制中可选的动作：属于目标社区且不在当前社区中的候选节点；没有时只能停止
+        @param remaining: 形状为(bs, n_nodes)的目标社区剩余节点mask
+        @param valid_index: 未处理完的样本
+        @param batch_candidates: 各样本的候选节点
+        @param width: 补齐后的动作数（含停止动作）
+        @return: 形状为[len(valid_index), width]的bool mask
+        '''
+        lens = np.array([len(x) for x in batch_candidates], dtype=np.int64)
+        flat = np.fromiter(itertools.chain.from_iterable(batch_candidates), dtype=np.int64, count=int(lens.sum()))
+        rows = np.repeat(np.arange(len(lens)), lens)
+        cols = np.arange(len(flat)) - np.repeat(np.cumsum(lens) - lens, lens)
+        mask = np.zeros((len(lens), width), dtype=bool)
+        mask[rows, cols] = remaining[np.asarray(valid_index, dtype=np.int64)[rows], flat]
+        stop = ~mask.any(1)
+        mask[stop, lens[stop]] = True
+        return torch.from_numpy(mask).to(self.device)
+
+    def addParentNodes(self, oldIds: List[int]) -> bool:
+        '''
+        把父图中oldIds的kego网络加入当前图，并更新GNN中的邻接矩阵
+        @param oldIds: 父图中的节点编号
+        @return: 是否新增了节点
+        '''
+        # 父图不变，某节点的kego合并进当前图后无需再次计算
+        oldIds = [x for x in dict.fromkeys(oldIds) if x not in self._expanded_old_ids]
+        if len(oldIds) == 0:
+            return False
+        self._expanded_old_ids.update(oldIds)
+        if not self.graph.add_parent_k_ego(oldIds, self.args.k_ego_subG, self.args.old_to_new_node_mapping,
+                                           self.args.new_to_old_node_mapping):
+            return False
+        # 存在新增加的节点，图已更新
+        self.close_workers()
+        # 更新 self.n_nodes 以反映新的节点总数
+        self.n_nodes = self.graph.n_nodes
+        self.conv.updateGraph(self.graph)
+        return True
+
+    def markExpanded(self, oldIds: List[int]):
+        '''
+        记录kego已经加入当前图的父图节点，之后addParentNodes不再重复计算
+        @param oldIds: 父图中的节点编号
+        '''
+        self._expanded_old_ids.update(oldIds)
 
     def updateGraphAndFeatAndConv(self, z_nodes, bs, new_nodes):
         '''
-        在生成社区阶段，对于新增加的节点，需要更新图与GNN中邻居矩阵
-        '''
-        oldId = self.args.new_to_old_node_mapping[new_nodes[0]]
-        oldIdnodeKego = self.graph.parentGraph.k_ego([oldId], self.args.k_ego_subG)
-        start_key = max(self.args.new_to_old_node_mapping.keys()) + 1
-        newIDnode_nei = dict()
-        for oldIdnode in oldIdnodeKego:
-            if oldIdnode not in self.args.old_to_new_node_mapping:
-                # newIDnode_nei记录：key:不在当前图中的节点, value:key节点当前图(以及新增节点)中的邻居
-                self.args.old_to_new_node_mapping[oldIdnode] = start_key
-                self.args.new_to_old_node_mapping[start_key] = oldIdnode
-                newIDnode_nei[start_key] = set()
-                start_key += 1
-        # 测试
-        # print("len-newIDnode_nei:", len(newIDnode_nei))
-        for newIdNode in newIDnode_nei.keys():
-            oldIdnode = self.args.new_to_old_node_mapping[newIdNode]
-            for oldIdnei_node in self.graph.parentGraph.neighbors[oldIdnode]:
-                if oldIdnei_node in self.args.old_to_new_node_mapping:
-                    # 新增加的节点之间可能存在边，这样添加确保不漏掉新增加节点之间的边
-                    newIDnode_nei[newIdNode].add(self.args.old_to_new_node_mapping[oldIdnode])
-        if len(newIDnode_nei) != 0:
-            # 存在新增加的节点，需要更新图，newIDnode_neizh
-            self.graph.add_nodes_with_neighbors(newIDnode_nei)
-            new_n_nodes = self.graph.n_nodes
-            extended_matrix = sp.csc_matrix((new_n_nodes, bs), dtype=np.float32)
-            extended_matrix[:self.n_nodes, :] = z_nodes
-            z_nodes = extended_matrix
-            # 更新 self.n_nodes 以反映新的节点总数
-            self.n_nodes = new_n_nodes
-            self.conv.updateGraph(self.graph)
+        在生成社区阶段，对于新增加的节点，需要更新图与GNN中邻居矩阵；批量生成时对每条轨迹新增的节点都进行扩展
+        '''
+        oldIds = [self.args.new_to_old_node_mapping[v] for v in new_nodes if v != STOP]
+        if len(oldIds) != 0 and self.addParentNodes(oldIds):
+            z_nodes.resize(self.n_nodes)
         return z_nodes
 
-    def _sample_trajectories(self, env: ExpansionEnv, isTrain):
+    def _sample_trajectories(self, env: ExpansionEnv, isTrain, record: Optional[list] = None):
         '''
         采样轨迹或生成社区
         @param env: 环境
         @param isTrain: 是否是训练
+        @param record: 不为None时，追加每一步的(样本下标, vals_seed, vals_node, indptr, 动作)
         @return: 选择的节点以及概率
         '''
         bs = env.bs
         # 这里x_seeds = delta_x_nodes，shape=（总结点数,bs）共bs个one-hot向量
         x_seeds, delta_x_nodes = env.reset()
         # z_seeds是经过一个图卷积的x_seeds，形状不变
-        z_seeds = self.conv(x_seeds)
+        z_seeds = self._new_features('seeds', bs)
+        z_seeds.add(self.conv(x_seeds))
         # 创建一个shape=（总结点数,bs）空矩阵
-        z_nodes = sp.csc_matrix((self.n_nodes, bs), dtype=np.float32)
-        episode_logps = [[] for _ in range(bs)]
-        new_nodes = []
+        z_nodes = self._new_features('nodes', bs)
+        new_nodes = None
         # 这里的条件是对bs个节点扩展是否结束的判断，全部结束时退出循环
         while not env.done:
             # 将每次增加的节点表示加到当前社区中节点表示上，z_nodes为当前社区所有节点的表示
-            z_nodes += self.conv(delta_x_nodes)
+            z_nodes.add(self.conv(delta_x_nodes))
 
-            if isTrain == False and len(new_nodes) != 0:
+            if isTrain == False and new_nodes is not None:
                 # 如果不是训练过程，每添加一个节点，更新一次图
                 z_nodes = self.updateGraphAndFeatAndConv(z_nodes, bs, new_nodes)
                 env.updateGraph(self.graph)
                 seeds = [env.data[i][0] for i in range(bs)]
                 x_seeds = env.make_single_node_encoding(seeds)
-                z_seeds = self.conv(x_seeds)
+                z_seeds = self._new_features('seeds', bs)
+                z_seeds.add(self.conv(x_seeds))
 
             valid_index = env.valid_index
-            *model_inputs, batch_candidates = self._prepare_inputs(valid_index, env.trajectories, z_nodes, z_seeds)
-            batch_logits = self.model(*model_inputs)
-            actions, logps = self._sample_actions(batch_logits)
-            new_nodes = [x[i] if i < len(x) else 'EOS' for i, x in zip(actions, batch_candidates)]      # 这一步记录添加的节点
+            *model_inputs, batch_candidates = self._prepare_inputs(valid_index, env.buffer, env.boundaries,
+                                                                      z_nodes, z_seeds)
+            batch_logits, batch_mask = self.model.forward_padded(*model_inputs)
+            actions, logps = self._sample_actions(batch_logits, batch_mask)
+            if record is not None:
+                vals_seed, vals_node, indptr = model_inputs
+                record.append((valid_index, vals_seed.cpu().numpy(), vals_node.cpu().numpy(), indptr, actions))
+            new_nodes = [x[i] if i < len(x) else STOP for i, x in zip(actions, batch_candidates)]      # 这一步记录添加的节点
             # 新增加节点初始编码表示 one-hot 向量
             delta_x_nodes = env.step(new_nodes, valid_index)
-            # 记录每增加一个节点对应的，对数概率、value、熵
-            for i, v1 in zip(valid_index, logps):
-                episode_logps[i].append(v1)
-
-        logps = nn.utils.rnn.pad_sequence([torch.stack(x) for x in episode_logps], batch_first=True)
+            # 记录每增加一个节点对应的对数概率
+            env.buffer.add_logps(valid_index, logps)
 
         # 返回最终社区env.trajectories，扩展过程中的对数概率
-        return env.trajectories, logps
+        return env.trajectories, env.buffer.padded_logps()
 
-    def _prepare_inputs(self, valid_index: List[int], trajectories: List[List[int]],
-                        z_nodes: sp.csc_matrix, z_seeds: sp.csc_matrix):
+    def _prepare_inputs(self, valid_index: np.ndarray, buffer: RolloutBuffer, boundaries: List[Set[int]],
+                        z_nodes: Union[SparseFeatures, DenseFeatures],
+                        z_seeds: Union[SparseFeatures, DenseFeatures]):
         '''
         为expander准备输入，获取动作空间、节有效点表示
         @param valid_index: 未处理完的节点
-        @param trajectories: 当前社区
+        @param buffer: 轨迹缓冲区，保存当前社区
+        @param boundaries: 当前社区的边界（由ExpansionEnv增量维护）
         @param z_nodes: 社区表示
         @param z_seeds: 种子节点表示
         @return: 降低一个维度，使用记录下标的方式
         '''
-        vals_seed = []
-        vals_node = []
+        involved = []
         indptr = []
         offset = 0
         batch_candidates = []
         for i in valid_index:
-            boundary_nodes = self.graph.outer_boundary(trajectories[i])     # 获取当前社区的边界节点
-            candidate_nodes = list(boundary_nodes)
+            candidate_nodes = list(boundaries[i])     # 当前社区的边界节点
             # assert len(candidate_nodes)
-            involved_nodes = candidate_nodes + trajectories[i]  # involved_nodes保存当前社区和其边界节点
+            involved_nodes = candidate_nodes + buffer.community(i)  # involved_nodes保存当前社区和其边界节点
             batch_candidates.append(candidate_nodes)  # candidates
-            vals_seed.append(z_seeds.T[i, involved_nodes].todense())   # 本来是使用经过GNN，这里将其缩减维只跟involved_nodes相关的表示，可以很容易知道vals_seed中各元素长度不等
-            vals_node.append(z_nodes.T[i, involved_nodes].todense())    # z_nodes是当前社区的向量表示
+            involved.extend(involved_nodes)
             indptr.append((offset, offset + len(involved_nodes), offset + len(candidate_nodes)))        # 因为各个社区/节点的向量长度不一样，这里记录
             offset += len(involved_nodes)
 
-        vals_seed = np.array(np.concatenate(vals_seed, 1))[0]           # 将一个bs的vals_seed拼接成一个一维向量
-        vals_node = np.array(np.concatenate(vals_node, 1))[0]
-        vals_seed = torch.from_numpy(vals_seed).to(self.device)
-        vals_node = torch.from_numpy(vals_node).to(self.device)
+        # 一次性按(节点, 样本)取出所有需要的表示，vals_seed中各样本长度不等，拼接成一维向量
+        rows = np.array(involved, dtype=np.int64)
+        cols = np.repeat(np.array(valid_index, dtype=np.int64), [end - start for start, end, _ in indptr])
+        vals_seed = torch.from_numpy(z_seeds.gather(rows, cols)).to(self.device)
+        vals_node = torch.from_numpy(z_nodes.gather(rows, cols)).to(self.device)
         indptr = np.array(indptr)                   # 由于每个节点的表示长度不一样，这里indptr用于标记start和end的位置
         # 准备输入 vals_seed记录bs种子节点的向量表示，vals_node记录当前bs个社区节点的向量表示。
         # 由于转换成一个维度，这里使用indptr区分各个节点/社区的位置
         # batch_candidates存放每个社区的候选的节点，即边界节点/动作空间
         return vals_seed, vals_node, indptr, batch_candidates
 
-    def _sample_actions(self, batch_logits: List) -> (List, List, List):
+    def _new_features(self, name: str, bs: int) -> Union[SparseFeatures, DenseFeatures]:
+        '''
+        创建形状为(n_nodes, bs)的全零表示；稠密模式下复用上一次的数组
+        @param name: 缓冲区名称
+        @param bs: batch大小
+        '''
+        if self.feature_store == 'dense':
+            features = DenseFeatures(self.n_nodes, bs, self._feature_buffers.get((name, bs)))
+            self._feature_buffers[(name, bs)] = features.buffer
+            return features
+        return SparseFeatures(self.n_nodes, bs)
+
+    def _sample_actions(self, batch_logits: torch.Tensor, batch_mask: torch.Tensor) -> (np.ndarray, torch.Tensor):
         '''
         采样动作
-        @param batch_logits: 动作空间种节点对应的对数概率
+        @param batch_logits: 补齐后的动作空间对数概率，形状为[bs, max_candidates+1]
+        @param batch_mask: 有效动作的mask
         @return:选择的节点与其对应的对数概率
         '''
-        batch = []
-        for logits in batch_logits:
-            ps = torch.exp(logits) + 1e-8
-            # 进行多项式采样
-            try:
-                action = torch.multinomial(ps, 1).item()
-            except Exception as e:
-                print(f"Caught an exception: {e}")
-                print(f"ps: {ps}")
-                print(f"logits: {logits}")
-            logp = logits[action]
-            batch.append([action, logp])
-        actions, logps = zip(*batch)
-        actions = np.array(actions)
+        ps = torch.where(batch_mask, torch.exp(batch_logits) + 1e-8, torch.zeros_like(batch_logits))
+        # 进行多项式采样
+        actions = torch.multinomial(ps, 1)
+        logps = batch_logits.gather(1, actions).squeeze(1)
+        actions = actions.squeeze(1).cpu().numpy()
         # 动作、对数概率
         return actions, logps
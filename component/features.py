@@ -0,0 +1,105 @@
+from typing import Optional
+
+import numpy as np
+from scipy import sparse as sp
+
+
+def gather_csc(z: sp.csc_matrix, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+    '''
+    直接在CSC的列数据上批量取值z[rows, cols]
+    @param z: 形状为(n_nodes, bs)的表示
+    @param rows: 节点下标
+    @param cols: 样本下标
+    @return: float32数组
+    '''
+    if not sp.isspmatrix_csc(z):
+        z = sp.csc_matrix(z)
+    if not z.has_sorted_indices:
+        z.sort_indices()
+    n_nodes = z.shape[0]
+    # 列内下标有序，加上列偏移后整体有序，可以直接二分查找
+    keys = np.repeat(np.arange(z.shape[1], dtype=np.int64) * n_nodes, np.diff(z.indptr)) + z.indices
+    query = cols * n_nodes + rows
+    out = np.zeros(len(query), dtype=np.float32)
+    if len(keys) == 0:
+        return out
+    pos = np.searchsorted(keys, query)
+    pos[pos == len(keys)] = 0
+    hit = keys[pos] == query
+    out[hit] = z.data[pos[hit]]
+    return out
+
+
+class SparseFeatures:
+    '''
+    以csc_matrix保存形状为(n_nodes, bs)的节点表示
+    '''
+
+    def __init__(self, n_nodes: int, bs: int):
+        self.mat = sp.csc_matrix((n_nodes, bs), dtype=np.float32)
+
+    @property
+    def shape(self):
+        return self.mat.shape
+
+    def add(self, delta: sp.spmatrix):
+        self.mat = self.mat + delta
+
+    def gather(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        return gather_csc(self.mat, rows, cols)
+
+    def resize(self, n_nodes: int):
+        '''
+        图中新增节点后扩展行数，新增行为0
+        @param n_nodes: 新的节点数
+        '''
+        # 新增行全为0，CSC的indptr不变，只需修改形状
+        mat = self.mat
+        self.mat = sp.csc_matrix((mat.data, mat.indices, mat.indptr), shape=(n_nodes, mat.shape[1]), copy=False)
+
+
+class DenseFeatures:
+    '''
+    以稠密float32数组保存形状为(n_nodes, bs)的节点表示，原地累加，
+    内存占用固定且每步不再分配新的矩阵
+    '''
+
+    def __init__(self, n_nodes: int, bs: int, out: Optional[np.ndarray] = None):
+        if out is not None and out.shape[0] >= n_nodes and out.shape[1] == bs:
+            buffer = out
+            buffer[:n_nodes].fill(0)
+        else:
+            buffer = np.zeros((n_nodes, bs), dtype=np.float32)
+        self.buffer = buffer
+        self.n_nodes = n_nodes
+
+    @property
+    def mat(self) -> np.ndarray:
+        return self.buffer[:self.n_nodes]
+
+    @property
+    def shape(self):
+        return self.n_nodes, self.buffer.shape[1]
+
+    def add(self, delta: sp.spmatrix):
+        delta = sp.csc_matrix(delta)
+        delta.sum_duplicates()
+        cols = np.repeat(np.arange(delta.shape[1]), np.diff(delta.indptr))
+        self.buffer[delta.indices, cols] += delta.data
+
+    def gather(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        return self.buffer[rows, cols]
+
+    def resize(self, n_nodes: int):
+        '''
+        图中新增节点后扩展行数，容量不足时按倍数扩容
+        @param n_nodes: 新的节点数
+        '''
+        if n_nodes > self.buffer.shape[0]:
+            capacity = max(n_nodes, 2 * self.buffer.shape[0])
+            buffer = np.zeros((capacity, self.buffer.shape[1]), dtype=np.float32)
+            buffer[:self.n_nodes] = self.buffer[:self.n_nodes]
+            self.buffer = buffer
+        else:
+            self.buffer[self.n_nodes:n_nodes].fill(0)
+        self.n_nodes = n_nodes
@@ -1,14 +1,20 @@
+import collections
+
 import numpy as np
 from scipy import sparse as sp
 
-from .graph import Graph
+from .graph import Graph, csr_row_positions
 class GraphConv:
 
-    def __init__(self, graph: Graph, k: int = 3, alpha: float = 0.85):
+    def __init__(self, graph: Graph, k: int = 3, alpha: float = 0.85, cache_size: int = 0):
         self.graph = graph
         self.k = k
         self.alpha = alpha
-        self.normlized_adj_mat = self._normalize_adj(graph.adj_mat).astype(np.float32)
+        # 传播是线性的，缓存每个节点one-hot的传播结果（LRU），按缓存的非零元总数限制内存，图变化时清空
+        self.cache_size = cache_size
+        self._cache = collections.OrderedDict()
+        self._cache_nnz = 0
+        self._reset_normalization(graph)
 
     def __repr__(self):
         return f'Conv_{self.k}_{self.alpha}'
@@ -19,15 +25,166 @@ class GraphConv:
     def __call__(self, *args, **kwargs):
         return self.forward(*args, **kwargs)
 
+    def __getstate__(self):
+        # 缓存不跨进程复制
+        state = self.__dict__.copy()
+        state['_cache'] = collections.OrderedDict()
+        state['_cache_nnz'] = 0
+        return state
+
+    @property
+    def normlized_adj_mat(self) -> sp.csr_matrix:
+        if self._delta_norm is not None:
+            self._fold_delta()
+        return self._base_norm
+
+    def _propagate(self, x: sp.spmatrix) -> sp.spmatrix:
+        if self._delta_norm is None:
+            return self._base_norm @ x
+        return self._base_norm @ x + self._delta_norm @ x
+
     def forward(self, x: sp.spmatrix):
+        if self.cache_size > 0:
+            return self._forward_cached(x)
+        return self._diffuse(x)
+
+    def _diffuse(self, x: sp.spmatrix):
         init_val = x
         for _ in range(self.k):
-            x = self.alpha * (self.normlized_adj_mat @ x) + (1 - self.alpha) * init_val
+            x = self.alpha * self._propagate(x) + (1 - self.alpha) * init_val
         return x
 
+    def _forward_cached(self, x: sp.spmatrix) -> sp.csc_matrix:
+        '''
+        输出为各节点缓存列的加权和，只对未命中的节点做一次批量传播；缓存的非零元总数超过cache_size时淘汰最久未用的列
+        @param x: 形状为(n_nodes, bs)的稀疏输入
+        '''
+        x = sp.csc_matrix(x)
+        n_nodes, bs = x.shape
+        nodes = x.indices.tolist()
+        missing = [u for u in dict.fromkeys(nodes) if u not in self._cache]
+        if missing:
+            onehot = sp.csc_matrix((np.ones(len(missing), dtype=np.float32), (missing, range(len(missing)))),
+                                   shape=(n_nodes, len(missing)))
+            z = sp.csc_matrix(self._diffuse(onehot))
+            for j, u in enumerate(missing):
+                self._cache[u] = (z.indices[z.indptr[j]:z.indptr[j + 1]].copy(),
+                                  z.data[z.indptr[j]:z.indptr[j + 1]].copy())
+                self._cache_nnz += int(z.indptr[j + 1] - z.indptr[j])
+        rows, vals, cols = [], [], []
+        weights = x.data.tolist()
+        col_ids = np.repeat(np.arange(bs), np.diff(x.indptr)).tolist()
+        for u, w, c in zip(nodes, weights, col_ids):
+            idx, data = self._cache[u]
+            self._cache.move_to_end(u)
+            rows.append(idx)
+            vals.append(data * w if w != 1 else data)
+            cols.append(np.full(len(idx), c, dtype=np.int64))
+        while self._cache_nnz > self.cache_size and self._cache:
+            _, (idx, _) = self._cache.popitem(last=False)
+            self._cache_nnz -= len(idx)
+        if not rows:
+            return sp.csc_matrix((n_nodes, bs), dtype=np.float32)
+        return sp.csc_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+                             shape=(n_nodes, bs))
+
     def updateGraph(self, graph: Graph):
-        self.graph = graph
-        self.normlized_adj_mat = self._normalize_adj(graph.adj_mat).astype(np.float32)
+        '''
+        图发生变化后更新归一化邻接矩阵；若只是在原图上新增了边，仅更新受影响的元素
+        @param graph: 新图
+        '''
+        self._cache.clear()
+        self._cache_nnz = 0
+        edge_log = getattr(graph, 'edge_log', None)
+        if graph is not self.graph or edge_log is not self._edge_log or len(edge_log) < self._log_pos:
+            self.graph = graph
+            self._reset_normalization(graph)
+            return
+        deltas = edge_log[self._log_pos:]
+        self._log_pos = len(edge_log)
+        rows = np.concatenate([self._delta_rows] + [r for r, _ in deltas])
+        cols = np.concatenate([self._delta_cols] + [c for _, c in deltas])
+        self._update_normalization(graph.n_nodes, rows[len(self._delta_rows):], cols[len(self._delta_cols):])
+        self._delta_rows, self._delta_cols = rows, cols
+        self._build_delta_norm()
+        # 新增边累积过多时并入基础矩阵，保持乘法效率
+        if 4 * len(self._delta_rows) > self._base_norm.nnz:
+            self._fold_delta()
+
+    def _reset_normalization(self, graph: Graph):
+        adj = graph.adj_mat
+        self._deg = np.asarray(adj.sum(1), dtype=np.float64).ravel()
+        self._base_norm = self._normalize_adj(adj).astype(np.float32).tocsr()
+        self._base_norm.sort_indices()
+        self._delta_rows = np.zeros(0, dtype=np.int64)
+        self._delta_cols = np.zeros(0, dtype=np.int64)
+        self._delta_norm = None
+        self._edge_log = getattr(graph, 'edge_log', None)
+        self._log_pos = len(self._edge_log) if self._edge_log is not None else 0
+
+    def _update_normalization(self, n_nodes: int, rows: np.ndarray, cols: np.ndarray):
+        '''
+        新增边(rows, cols)后，只重新缩放度发生变化的行与列
+        @param n_nodes: 新的节点数
+        @param rows: 新增边的一端
+        @param cols: 新增边的另一端
+        '''
+        base = self._base_norm
+        n_base = base.shape[0]
+        if n_nodes > len(self._deg):
+            self._deg = np.concatenate([self._deg, np.zeros(n_nodes - len(self._deg))])
+        if n_nodes > n_base:
+            # 只在CSR末尾补空行，不复制data与indices
+            indptr = np.concatenate([base.indptr, np.repeat(base.indptr[-1:], n_nodes - n_base)])
+            base = sp.csr_matrix((base.data, base.indices, indptr), shape=(n_nodes, n_nodes))
+            self._base_norm = base
+        if len(rows) == 0:
+            return
+        touched, counts = np.unique(np.concatenate([rows, cols]), return_counts=True)
+        old_deg = self._deg[touched]
+        self._deg[touched] += counts
+        scale = np.sqrt((old_deg + 1e-9) / (self._deg[touched] + 1e-9))
+        # 基础矩阵中，受影响的元素位于touched的行及其邻居的行中
+        in_base = touched < n_base
+        touched, scale = touched[in_base], scale[in_base]
+        if len(touched) == 0:
+            return
+        touched_rows = np.union1d(touched, base.indices[self._row_positions(base, touched)])
+        pos = self._row_positions(base, touched_rows)
+        pos_rows = np.repeat(touched_rows, np.diff(base.indptr)[touched_rows])
+        factor = np.ones(len(pos))
+        row_hit = np.searchsorted(touched, pos_rows)
+        row_hit[row_hit == len(touched)] = 0
+        row_mask = touched[row_hit] == pos_rows
+        factor[row_mask] *= scale[row_hit[row_mask]]
+        pos_cols = base.indices[pos]
+        col_hit = np.searchsorted(touched, pos_cols)
+        col_hit[col_hit == len(touched)] = 0
+        col_mask = touched[col_hit] == pos_cols
+        factor[col_mask] *= scale[col_hit[col_mask]]
+        base.data[pos] *= factor.astype(np.float32)
+
+    @staticmethod
+    def _row_positions(mat: sp.csr_matrix, rows: np.ndarray) -> np.ndarray:
+        return csr_row_positions(mat.indptr, rows)
+
+    def _build_delta_norm(self):
+        n_nodes = len(self._deg)
+        if len(self._delta_rows) == 0:
+            self._delta_norm = None
+            return
+        d_inv_sqrt = np.power(self._deg + 1e-9, -0.5)
+        rows = np.concatenate([self._delta_rows, self._delta_cols])
+        cols = np.concatenate([self._delta_cols, self._delta_rows])
+        data = (d_inv_sqrt[rows] * d_inv_sqrt[cols]).astype(np.float32)
+        self._delta_norm = sp.csr_matrix((data, (rows, cols)), shape=(n_nodes, n_nodes))
+
+    def _fold_delta(self):
+        self._base_norm = (self._base_norm + self._delta_norm).tocsr()
+        self._base_norm.sort_indices()
+        self._delta_rows = np.zeros(0, dtype=np.int64)
+        self._delta_cols = np.zeros(0, dtype=np.int64)
+        self._delta_norm = None
 
     @staticmethod
     def _normalize_adj(adj: sp.spmatrix) -> sp.spmatrix:
@@ -37,3 +194,54 @@ class GraphConv:
         d_inv_sqrt[np.isinf(d_inv_sqrt)] = 0.
         d_mat_inv_sqrt = sp.diags(d_inv_sqrt)
         return adj.dot(d_mat_inv_sqrt).transpose().dot(d_mat_inv_sqrt)
+
+
+class PushConv(GraphConv):
+    '''
+    基于局部push的传播：只在种子附近的节点上展开APPNP的k步扩散，
+    残差低于eps的节点不再向外推送，代价只与局部邻域大小相关
+    '''
+
+    def __init__(self, graph: Graph, k: int = 3, alpha: float = 0.85, eps: float = 1e-4, cache_size: int = 0):
+        super().__init__(graph, k, alpha, cache_size)
+        self.eps = eps
+
+    def __repr__(self):
+        return f'PushConv_{self.k}_{self.alpha}_{self.eps}'
+
+    def _diffuse(self, x: sp.spmatrix):
+        '''
+        x_k = sum_{t<k} (1-alpha) alpha^t A^t x + alpha^k A^k x，其中A^t x通过逐层push得到
+        @param x: 形状为(n_nodes, bs)的稀疏输入
+        @return: 形状相同的csc矩阵
+        '''
+        # 直接在基础矩阵与新增边矩阵上push，不触发合并
+        mats = [self._base_norm] if self._delta_norm is None else [self._base_norm, self._delta_norm]
+        n_nodes, bs = x.shape
+        x = sp.coo_matrix(x)
+        # 以(列, 节点)编码的残差
+        keys = x.col.astype(np.int64) * n_nodes + x.row
+        residual = x.data.astype(np.float64)
+        out_keys, out_vals = [keys], [(1 - self.alpha) * residual]
+        for t in range(1, self.k + 1):
+            weight = self.alpha ** t
+            keep = np.abs(residual) * weight >= self.eps
+            keys, residual = keys[keep], residual[keep]
+            if len(keys) == 0:
+                break
+            cols, nodes = np.divmod(keys, n_nodes)
+            pushed_keys, pushed_vals = [], []
+            for adj in mats:
+                pos = self._row_positions(adj, nodes)
+                lens = np.diff(adj.indptr)[nodes]
+                pushed_keys.append(np.repeat(cols * n_nodes, lens) + adj.indices[pos])
+                pushed_vals.append(np.repeat(residual, lens) * adj.data[pos])
+            keys, inverse = np.unique(np.concatenate(pushed_keys), return_inverse=True)
+            pushed_vals = np.concatenate(pushed_vals)
+            residual = np.bincount(inverse, weights=pushed_vals, minlength=len(keys))
+            out_keys.append(keys)
+            out_vals.append((weight if t == self.k else (1 - self.alpha) * weight) * residual)
+        keys = np.concatenate(out_keys)
+        vals = np.concatenate(out_vals)
+        cols, nodes = np.divmod(keys, n_nodes)
+        return sp.csc_matrix((vals.astype(np.float32), (nodes, cols)), shape=(n_nodes, bs))
@@ -1,11 +1,69 @@
 from typing import Union, Optional, List, Set, Dict
 import collections
+import itertools
 
 import numpy as np
 from scipy import sparse as sp
 import random
 
 
+def edges_to_csr(edges: np.ndarray) -> (np.ndarray, np.ndarray):
+    '''
+    将边列表转换为对称的CSR数组（去除自环与重边）
+    @param edges: 形状为(E, 2)的边列表
+    @return: indptr, indices
+    '''
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    u, v = edges[:, 0], edges[:, 1]
+    keep = u != v
+    n_nodes = int(edges.max()) + 1 if len(edges) else 0
+    if n_nodes == 0:
+        return np.zeros(1, dtype=np.int32), np.zeros(0, dtype=np.int32)
+    rows = np.concatenate([u[keep], v[keep]])
+    cols = np.concatenate([v[keep], u[keep]])
+    keys = np.unique(rows * n_nodes + cols)
+    rows, cols = keys // n_nodes, keys % n_nodes
+    counts = np.bincount(rows, minlength=n_nodes)
+    index_dtype = np.int32 if len(keys) < np.iinfo(np.int32).max else np.int64
+    indptr = np.zeros(n_nodes + 1, dtype=index_dtype)
+    np.cumsum(counts, out=indptr[1:])
+    return indptr, cols.astype(index_dtype)
+
+
+def csr_row_positions(indptr: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    '''
+    CSR中若干行的全部元素在indices/data中的位置
+    @param indptr: CSR行指针
+    @param rows: 行下标
+    @return: 按行依次拼接的位置
+    '''
+    starts = indptr[rows].astype(np.int64)
+    lens = indptr[rows + 1] - starts
+    return np.repeat(starts - np.cumsum(lens) + lens, lens) + np.arange(int(lens.sum()))
+
+
+def csr_induced(indptr: np.ndarray, indices: np.ndarray, nodes: np.ndarray) -> (np.ndarray, np.ndarray):
+    '''
+    直接在indptr/indices上取诱导子图，不构造带data的稀疏矩阵，第i个局部节点对应nodes[i]
+    @param indptr: CSR行指针
+    @param indices: CSR列下标
+    @param nodes: 互不重复的节点数组
+    @return: 子图的indptr，indices（局部编号，行内顺序与原图一致；nodes有序时行内有序）
+    '''
+    order = np.argsort(nodes, kind='stable')
+    sorted_nodes = nodes[order]
+    positions = csr_row_positions(indptr, nodes)
+    lens = (indptr[nodes + 1] - indptr[nodes]).astype(np.int64)
+    rows = np.repeat(np.arange(len(nodes)), lens)
+    cols = indices[positions]
+    loc = np.minimum(np.searchsorted(sorted_nodes, cols), max(len(nodes) - 1, 0))
+    keep = sorted_nodes[loc] == cols if len(nodes) else np.zeros(0, dtype=bool)
+    rows, cols = rows[keep], order[loc[keep]]
+    sub_indptr = np.zeros(len(nodes) + 1, dtype=indptr.dtype)
+    np.cumsum(np.bincount(rows, minlength=len(nodes)), out=sub_indptr[1:])
+    return sub_indptr, cols.astype(indices.dtype)
+
+
 class Graph:
 
     def __init__(self, edges):
@@ -13,27 +71,127 @@ class Graph:
 
     @staticmethod
     def _init_from_edges(edges: np.ndarray) -> (Dict[int, Set[int]], int, sp.spmatrix):
-        neighbors = collections.defaultdict(set)
-        degrees = {}
-        max_id = -1
-        for u, v in edges:
-            degrees[u] = degrees.get(u, 0) + 1
-            degrees[v] = degrees.get(v, 0) + 1
-
-            max_id = max(max_id, u, v)
-            if u != v:
-                neighbors[u].add(v)
-                neighbors[v].add(u)
-        n_nodes = len(neighbors)
-        if (max_id + 1) != n_nodes:
+        edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        # 去重、去自环、建CSR均在numpy中完成
+        indptr, indices = edges_to_csr(edges)
+        n_nodes = len(indptr) - 1
+        if np.any(np.diff(indptr) == 0):
             raise ValueError('Please re-label nodes first!')
-        adj_mat = sp.csr_matrix((np.ones(len(edges)), edges.T), shape=(n_nodes, n_nodes))
-        adj_mat += adj_mat.T
+        degrees = dict(enumerate(np.bincount(edges.ravel(), minlength=n_nodes).tolist()))
+        neighbors = Graph._neighbors_from_csr(indptr, indices)
+        adj_mat = sp.csr_matrix((np.ones(len(indices)), indices, indptr), shape=(n_nodes, n_nodes))
         return neighbors, n_nodes, adj_mat, degrees
 
+    @staticmethod
+    def _neighbors_from_csr(indptr: np.ndarray, indices: np.ndarray) -> Dict[int, Set[int]]:
+        ptr = np.asarray(indptr).tolist()
+        nbs = np.asarray(indices).tolist()
+        neighbors = collections.defaultdict(set)
+        for u in range(len(ptr) - 1):
+            neighbors[u] = set(nbs[ptr[u]:ptr[u + 1]])
+        return neighbors
+
+    @classmethod
+    def from_csr(cls, indptr: np.ndarray, indices: np.ndarray):
+        '''
+        直接由CSR数组构建图（对称、无自环、无重边），避免重新解析边文件
+        @param indptr: CSR行指针
+        @param indices: CSR列下标
+        '''
+        graph = cls.__new__(cls)
+        n_nodes = len(indptr) - 1
+        graph.neighbors = cls._neighbors_from_csr(indptr, indices)
+        graph.degree = dict(enumerate(np.diff(indptr).tolist()))
+        graph.n_nodes = n_nodes
+        graph.adj_mat = sp.csr_matrix((np.ones(len(indices)), indices, indptr), shape=(n_nodes, n_nodes))
+        return graph
+
+    @property
+    def adj_mat(self) -> sp.csr_matrix:
+        if self._pending_edges:
+            self._adj_mat = self._merge_pending_edges(self._adj_mat)
+        return self._adj_mat
+
+    @adj_mat.setter
+    def adj_mat(self, adj_mat: sp.spmatrix):
+        self._adj_mat = adj_mat
+        self._pending_edges = []
+        self.edge_log = []
+
+    def _merge_pending_edges(self, adj: sp.spmatrix) -> sp.csr_matrix:
+        '''
+        将缓存的新增边合并进邻接矩阵：先在CSR末尾补空行、补列，再加上新增边
+        @param adj: 当前邻接矩阵
+        @return: 合并后的邻接矩阵
+        '''
+        n_nodes = self.n_nodes
+        adj = adj.tocsr()
+        indptr = np.concatenate([adj.indptr, np.repeat(adj.indptr[-1:], n_nodes - adj.shape[0])])
+        adj = sp.csr_matrix((adj.data, adj.indices, indptr), shape=(n_nodes, n_nodes))
+        rows = np.concatenate([r for r, _ in self._pending_edges])
+        cols = np.concatenate([c for _, c in self._pending_edges])
+        self._pending_edges = []
+        if len(rows):
+            delta = sp.csr_matrix((np.ones(2 * len(rows), dtype=adj.dtype),
+                                   (np.concatenate([rows, cols]), np.concatenate([cols, rows]))),
+                                  shape=(n_nodes, n_nodes))
+            adj = adj + delta
+            adj.sort_indices()
+            # 重复添加的边只保留一条
+            adj.data[:] = 1
+        return adj
+
     def setParentGraph(self, parentGraph):
         self.parentGraph = parentGraph
 
+    def __getstate__(self):
+        # 传给采样进程时不复制父图，采样进程不会扩展当前图
+        state = self.__dict__.copy()
+        state.pop('parentGraph', None)
+        return state
+
+    def copy(self):
+        '''
+        复制当前图（CSR数组深拷贝），父图共享
+        '''
+        adj = self.adj_mat
+        graph = type(self).from_csr(adj.indptr.copy(), adj.indices.copy())
+        if hasattr(self, 'parentGraph'):
+            graph.setParentGraph(self.parentGraph)
+        return graph
+
+    def add_parent_k_ego(self, old_ids: List[int], k: int, old_to_new: Dict[int, int],
+                         new_to_old: Dict[int, int]) -> bool:
+        '''
+        把父图中old_ids的kego网络加入当前图，新节点按顺序从n_nodes开始编号，并原地更新映射
+        @param old_ids: 父图中的节点编号
+        @param k: k
+        @param old_to_new: 父图编号到当前图编号的映射
+        @param new_to_old: 当前图编号到父图编号的映射
+        @return: 是否新增了节点
+        '''
+        oldIdnodeKego = self.parentGraph.k_ego(old_ids, k)
+        # 新编号连续分配，下一个可用编号即当前节点数
+        start_key = self.n_nodes
+        newIDnode_nei = dict()
+        for oldIdnode in oldIdnodeKego:
+            if oldIdnode not in old_to_new:
+                # newIDnode_nei记录：key:不在当前图中的节点, value:key节点当前图(以及新增节点)中的邻居
+                old_to_new[oldIdnode] = start_key
+                new_to_old[start_key] = oldIdnode
+                newIDnode_nei[start_key] = set()
+                start_key += 1
+        for newIdNode in newIDnode_nei.keys():
+            oldIdnode = new_to_old[newIdNode]
+            for oldIdnei_node in self.parentGraph.neighbors[oldIdnode]:
+                if oldIdnei_node in old_to_new:
+                    # 新增加的节点之间可能存在边，这样添加确保不漏掉新增加节点之间的边
+                    newIDnode_nei[newIdNode].add(old_to_new[oldIdnei_node])
+        if len(newIDnode_nei) == 0:
+            return False
+        self.add_nodes_with_neighbors(newIDnode_nei)
+        return True
+
     def outer_boundary(self, nodes: Union[List, Set]) -> Set[int]:
         '''
         获取节点集的边界
@@ -46,6 +204,63 @@ class Graph:
         boundary.difference_update(nodes)
         return boundary
 
+    @staticmethod
+    def _as_array(nodes: Union[List, Set, np.ndarray]) -> np.ndarray:
+        if isinstance(nodes, np.ndarray):
+            return nodes.astype(np.int64, copy=False)
+        return np.fromiter(nodes, dtype=np.int64, count=len(nodes))
+
+    def k_ego_mask(self, nodes: Union[List, Set, np.ndarray], k: int) -> np.ndarray:
+        '''
+        以稀疏矩阵乘法逐层扩展边界，获取kego网络
+        @param nodes: 节点集
+        @param k: k
+        @return: 长度为n_nodes的布尔向量，kego中的节点为True
+        '''
+        adj = self.adj_mat
+        visited = np.zeros(self.n_nodes, dtype=bool)
+        frontier = np.unique(self._as_array(nodes))
+        visited[frontier] = True
+        for _ in range(k):
+            if len(frontier) == 0:
+                break
+            # 行向量 x^T A 的非零位置即为当前边界的全部邻居
+            x = sp.csr_matrix((np.ones(len(frontier), dtype=adj.dtype), frontier, [0, len(frontier)]),
+                              shape=(1, self.n_nodes))
+            reached = (x @ adj).indices
+            frontier = reached[~visited[reached]]
+            visited[frontier] = True
+        return visited
+
+    def gather_neighbors(self, nodes: np.ndarray) -> np.ndarray:
+        '''
+        一次性取出节点集所有邻居（可能重复）
+        @param nodes: 节点数组
+        @return: 邻居数组
+        '''
+        nbs = [self.neighbors[u] for u in nodes.tolist()]
+        return np.fromiter(itertools.chain.from_iterable(nbs), dtype=np.int64, count=sum(map(len, nbs)))
+
+    def k_ego_array(self, nodes: Union[List, Set, np.ndarray], k: int) -> np.ndarray:
+        '''
+        获取kego网络；节点集较小时只在触及的节点上逐层扩展，代价与kego大小相关而与全图大小无关，
+        节点集较大时（如已知社区）使用长度为n_nodes的mask
+        @param nodes: 节点集
+        @param k: k
+        @return: 有序的kego节点数组
+        '''
+        visited = np.unique(self._as_array(nodes))
+        if len(visited) * 64 >= self.n_nodes:
+            return np.flatnonzero(self.k_ego_mask(visited, k))
+        frontier = visited
+        for _ in range(k):
+            if len(frontier) == 0:
+                break
+            reached = np.unique(self.gather_neighbors(frontier))
+            frontier = reached[~np.isin(reached, visited, assume_unique=True)]
+            visited = np.union1d(visited, frontier)
+        return visited
+
     def k_ego(self, nodes: Union[List, Set], k: int) -> Set[int]:
         '''
         获取kego网络
@@ -53,48 +268,53 @@ class Graph:
         @param k: k
         @return:
         '''
-        ego_nodes = set(nodes)
-        current_boundary = set(nodes)
-        for _ in range(k):
-            current_boundary = self.outer_boundary(current_boundary) - ego_nodes
-            ego_nodes |= current_boundary
-        return ego_nodes
+        return set(self.k_ego_array(nodes, k).tolist())
 
-    def get_k_layer_subgraph_and_mapping(self, node_list: Union[List[int], Set[int]], k: int):
+    def get_k_layer_subgraph(self, node_list: Union[List[int], Set[int]], k: int):
         '''
-        获取节点集合的kego子图，给节点重新编号，返回映射结果
+        获取节点集合的kego诱导子图，节点按旧编号从小到大重新编号
         @param node_list: 节点集合
         @param k:
+        @return: 子图，new_to_old数组（新编号i对应旧编号new_to_old[i]）
         '''
+        new_to_old = self.k_ego_array(node_list, k)
+        subgraph = type(self).from_csr(*self.induced_csr(new_to_old))
+        return subgraph, new_to_old
 
-        # 获取k层邻居节点集
-        k_layer_neighbors = self.k_ego(node_list, k)
-
-        # 创建节点重新映射，旧节点ID映射到新节点ID
-        node_mapping = {old_id: new_id for new_id, old_id in enumerate(sorted(k_layer_neighbors))}
-
-        old_to_new_node_mapping = {old_id: new_id for new_id, old_id in enumerate(sorted(k_layer_neighbors))}
-
-        # 创建一个边的列表来存储子图的边，使用新的编号
-        subgraph_edges = []
-
-        # 遍历k层邻居节点集，获取边
-        for node in k_layer_neighbors:
-            for neighbor in self.neighbors[node]:
-                if neighbor in k_layer_neighbors:
-                    # 使用新的节点编号
-                    mapped_node = node_mapping[node]
-                    mapped_neighbor = node_mapping[neighbor]
-                    # 确保每条边只添加一次
-                    if mapped_node < mapped_neighbor:
-                        subgraph_edges.append((mapped_node, mapped_neighbor))
+    def csr_arrays(self) -> (np.ndarray, np.ndarray):
+        '''
+        @return: 邻接矩阵的indptr，indices
+        '''
+        adj = self.adj_mat
+        return adj.indptr, adj.indices
 
-        # 转换边列表为NumPy数组
-        edges_array = np.array(subgraph_edges)
+    def induced_csr(self, nodes: Union[List[int], np.ndarray]) -> (np.ndarray, np.ndarray):
+        '''
+        节点集的诱导子图，第i个局部节点对应nodes[i]
+        @param nodes: 互不重复的节点
+        @return: 子图的indptr，indices
+        '''
+        indptr, indices = self.csr_arrays()
+        return csr_induced(indptr, indices, self._as_array(nodes))
 
-        # 创建一个新的Graph实例作为子图
-        subgraph = Graph(edges_array)
+    @staticmethod
+    def map_old_to_new(new_to_old: np.ndarray, old_ids: Union[List[int], np.ndarray]) -> np.ndarray:
+        '''
+        旧编号映射为新编号（new_to_old有序，二分查找）
+        @param new_to_old: get_k_layer_subgraph返回的映射数组
+        @param old_ids: 旧编号
+        @return: 新编号
+        '''
+        return np.searchsorted(new_to_old, old_ids)
 
+    def get_k_layer_subgraph_and_mapping(self, node_list: Union[List[int], Set[int]], k: int):
+        '''
+        获取节点集合的kego子图，给节点重新编号，返回映射结果
+        @param node_list: 节点集合
+        @param k:
+        '''
+        subgraph, new_to_old = self.get_k_layer_subgraph(node_list, k)
+        node_mapping = dict(zip(new_to_old.tolist(), range(len(new_to_old))))
         return subgraph, node_mapping
 
     def sample_expansion_from_community(self, comm_nodes: Union[List, Set],
@@ -131,12 +351,16 @@ class Graph:
         扩展种子节点所在社区时，动态更新图
         @param newIDnode_nei: 新增节点
         '''
+        rows, cols = [], []
         for new_node, neighbors in newIDnode_nei.items():
             if new_node not in self.neighbors:  # 如果新节点还不在图中
                 self.n_nodes += 1  # 更新节点计数
                 self.neighbors[new_node] = set()  # 初始化新节点的邻居集合
 
             for neighbor in neighbors:
+                if neighbor != new_node and neighbor not in self.neighbors[new_node]:
+                    rows.append(new_node)
+                    cols.append(neighbor)
                 self.neighbors[new_node].add(neighbor)  # 添加新节点的邻居
                 if neighbor not in self.neighbors:  # 如果邻居节点也是新的
                     self.n_nodes += 1  # 更新节点计数
@@ -148,14 +372,195 @@ class Graph:
                 self.degree[new_node] = self.degree.get(new_node, 0) + 1
                 self.degree[neighbor] = self.degree.get(neighbor, 0) + 1
 
-        # 重新构建邻接矩阵
-        edges_list = []
-        for node, nbs in self.neighbors.items():
-            for nb in nbs:
-                if node < nb:  # 确保每条边只添加一次
-                    edges_list.append((node, nb))
+        # 只记录新增的边，邻接矩阵在下次访问时再合并；edge_log供GraphConv增量更新归一化矩阵
+        delta = (np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64))
+        self._pending_edges.append(delta)
+        self.edge_log.append(delta)
+
+
+class _NeighborView:
+    '''
+    以字典方式访问CSR图的邻居，返回值为集合，与Graph.neighbors保持一致
+    '''
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __getitem__(self, u: int) -> Set[int]:
+        return self.graph.row_neighbors(u)
+
+    def __contains__(self, u) -> bool:
+        return isinstance(u, (int, np.integer)) and 0 <= u < self.graph.n_nodes
+
+    def __iter__(self):
+        return iter(range(self.graph.n_nodes))
+
+    def __len__(self):
+        return self.graph.n_nodes
+
+    def keys(self):
+        return range(self.graph.n_nodes)
+
+    def items(self):
+        for u in range(self.graph.n_nodes):
+            yield u, self[u]
+
+
+class _DegreeView:
+    '''
+    以字典方式访问CSR图的度
+    '''
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __getitem__(self, u: int) -> int:
+        return self.graph.row_degree(u)
+
+    def __contains__(self, u) -> bool:
+        return u in self.graph.neighbors
+
+    def get(self, u, default=None):
+        return self[u] if u in self else default
+
+    def __len__(self):
+        return self.graph.n_nodes
+
 
-        edges_array = np.array(edges_list)
-        self.adj_mat = sp.csr_matrix((np.ones(len(edges_list)), edges_array.T), shape=(self.n_nodes, self.n_nodes))
-        self.adj_mat += self.adj_mat.T  # 使邻接矩阵对称
+class CSRGraph(Graph):
+    '''
+    基于int32 indptr/indices数组的紧凑图表示，接口与Graph一致，
+    邻居、边界与kego的计算均为向量化实现
+    '''
 
+    def __init__(self, edges):
+        indptr, indices = edges_to_csr(edges)
+        self._set_csr(indptr, indices)
+
+    @classmethod
+    def from_csr(cls, indptr: np.ndarray, indices: np.ndarray):
+        graph = cls.__new__(cls)
+        graph._set_csr(indptr, indices)
+        return graph
+
+    def _set_csr(self, indptr: np.ndarray, indices: np.ndarray):
+        self._indptr = indptr
+        self._indices = indices
+        self.n_nodes = len(indptr) - 1
+        self.neighbors = _NeighborView(self)
+        self.degree = _DegreeView(self)
+        self._adj_mat = None
+        self._pending_edges = []
+        # 尚未合并进CSR的新增边：节点 -> 新邻居，逐节点的查询不触发合并
+        self._pending_adj = collections.defaultdict(set)
+        self.edge_log = []
+
+    def _compact(self):
+        # 只需要合并后的indptr/indices，data用布尔型即可
+        adj = sp.csr_matrix((np.ones(len(self._indices), dtype=bool), self._indices, self._indptr),
+                            shape=(len(self._indptr) - 1,) * 2)
+        adj = self._merge_pending_edges(adj)
+        index_dtype = self._indices.dtype
+        self._indptr = adj.indptr.astype(index_dtype, copy=False)
+        self._indices = adj.indices.astype(index_dtype, copy=False)
+        self._pending_adj.clear()
+        self._adj_mat = None
+
+    @property
+    def indptr(self) -> np.ndarray:
+        if self._pending_edges:
+            self._compact()
+        return self._indptr
+
+    @property
+    def indices(self) -> np.ndarray:
+        if self._pending_edges:
+            self._compact()
+        return self._indices
+
+    @property
+    def adj_mat(self) -> sp.csr_matrix:
+        if self._pending_edges or self._adj_mat is None:
+            indptr, indices = self.indptr, self.indices
+            data = np.ones(len(indices))
+            self._adj_mat = sp.csr_matrix((data, indices, indptr), shape=(self.n_nodes, self.n_nodes))
+        return self._adj_mat
+
+    def csr_arrays(self) -> (np.ndarray, np.ndarray):
+        return self.indptr, self.indices
+
+    def _base_row(self, u: int) -> np.ndarray:
+        if u + 1 >= len(self._indptr):
+            return self._indices[:0]
+        return self._indices[self._indptr[u]:self._indptr[u + 1]]
+
+    def row_neighbors(self, u: int) -> Set[int]:
+        '''
+        节点u的邻居：已合并的CSR行加上尚未合并的新增邻居，不触发合并
+        '''
+        row = self._base_row(u)
+        pending = self._pending_adj.get(u)
+        if pending:
+            return set(np.union1d(row, np.fromiter(pending, dtype=np.int64, count=len(pending))).tolist())
+        return set(row.tolist())
+
+    def row_degree(self, u: int) -> int:
+        # 新增边不与已有边重复
+        return len(self._base_row(u)) + len(self._pending_adj.get(u, ()))
+
+    def k_ego_mask(self, nodes: Union[List, Set, np.ndarray], k: int) -> np.ndarray:
+        '''
+        直接在indptr/indices上逐层扩展边界，不构造邻接矩阵，内存映射的数组在进程间保持共享
+        '''
+        visited = np.zeros(self.n_nodes, dtype=bool)
+        frontier = np.unique(self._as_array(nodes))
+        visited[frontier] = True
+        for _ in range(k):
+            if len(frontier) == 0:
+                break
+            reached = np.unique(self.gather_neighbors(frontier))
+            frontier = reached[~visited[reached]]
+            visited[frontier] = True
+        return visited
+
+    def gather_neighbors(self, nodes: np.ndarray) -> np.ndarray:
+        '''
+        一次性取出节点集所有邻居（可能重复）
+        @param nodes: 节点数组
+        @return: 邻居数组
+        '''
+        n_base = len(self._indptr) - 1
+        in_base = nodes[nodes < n_base]
+        res = self._indices[csr_row_positions(self._indptr, in_base)]
+        if self._pending_adj:
+            pending = [self._pending_adj[u] for u in nodes.tolist() if u in self._pending_adj]
+            if pending:
+                extra = np.fromiter(itertools.chain.from_iterable(pending), dtype=np.int64,
+                                    count=sum(map(len, pending)))
+                res = np.concatenate([res, extra])
+        return res
+
+    def outer_boundary(self, nodes: Union[List, Set]) -> Set[int]:
+        nodes = self._as_array(nodes)
+        boundary = np.setdiff1d(self.gather_neighbors(nodes), nodes)
+        return set(boundary.tolist())
+
+    def add_nodes_with_neighbors(self, newIDnode_nei: Dict[int, Union[List[int], Set[int]]]):
+        n_old = self.n_nodes
+        edges = set()
+        for new_node, neighbors in newIDnode_nei.items():
+            old_neighbors = self.neighbors[new_node] if new_node < n_old else set()
+            for neighbor in neighbors:
+                if neighbor != new_node and neighbor not in old_neighbors:
+                    edges.add((min(new_node, neighbor), max(new_node, neighbor)))
+        rows = [u for u, _ in edges]
+        cols = [v for _, v in edges]
+        ids = list(newIDnode_nei.keys()) + cols
+        self.n_nodes = max(self.n_nodes, max(ids) + 1) if ids else self.n_nodes
+        for u, v in edges:
+            self._pending_adj[u].add(v)
+            self._pending_adj[v].add(u)
+        # 只记录新增的边，CSR数组在整体使用（邻接矩阵、诱导子图等）时再合并
+        delta = (np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64))
+        self._pending_edges.append(delta)
+        self.edge_log.append(delta)
@@ -0,0 +1,56 @@
+from typing import List
+
+import numpy as np
+from scipy import sparse as sp
+from scipy.sparse.csgraph import shortest_path
+
+
+def shortest_path_features(adj: sp.spmatrix, com: List[int]) -> np.ndarray:
+    '''
+    社区诱导子图的最短路径核特征：第d个元素为最短距离为d的有序节点对数（与grakel的ShortestPath(with_labels=False)一致）
+    @param adj: 图的邻接矩阵
+    @param com: 社区
+    @return: 一维计数向量
+    '''
+    nodes = np.asarray(com, dtype=np.int64)
+    dist = shortest_path(adj[nodes][:, nodes], directed=False, unweighted=True)
+    dist = dist[np.isfinite(dist) & (dist > 0)].astype(np.int64)
+    return np.bincount(dist).astype(np.float64)
+
+
+def _stack(features: List[np.ndarray], width: int = 0) -> np.ndarray:
+    width = max([width] + [len(x) for x in features])
+    phi = np.zeros((len(features), width))
+    for i, x in enumerate(features):
+        phi[i, :len(x)] = x
+    return phi
+
+
+class ShortestPathKernel:
+    '''
+    已知社区的最短路径核特征与Gram矩阵只计算一次，之后每个预测社区只需计算一行一列
+    '''
+
+    def __init__(self, adj: sp.spmatrix, communities: List[List[int]]):
+        self.phi = _stack([shortest_path_features(adj, com) for com in communities])
+        self.gram = self.phi @ self.phi.T
+
+    def similarity(self, adj: sp.spmatrix, com: List[int]) -> np.ndarray:
+        '''
+        预测社区插在最前面时，全部社区两两之间归一化后的相似度
+        @param adj: 当前图的邻接矩阵
+        @param com: 预测社区
+        @return: 形状为(n+1, n+1)的相似度矩阵，第0行/列对应com
+        '''
+        x = shortest_path_features(adj, com)
+        phi = _stack([x], self.phi.shape[1])[0]
+        row = self.phi @ phi[:self.phi.shape[1]]
+        n = len(self.gram)
+        km = np.empty((n + 1, n + 1))
+        km[1:, 1:] = self.gram
+        km[0, 1:] = km[1:, 0] = row
+        km[0, 0] = phi @ phi
+        diag = np.diagonal(km)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            simi = km / np.sqrt(np.outer(diag, diag))
+        return np.nan_to_num(simi)
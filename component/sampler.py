@@ -0,0 +1,154 @@
+import queue
+import random
+import threading
+from typing import List, Optional
+
+import numpy as np
+
+from .graph import Graph
+
+
+def expansion_walk(indptr: np.ndarray, indices: np.ndarray, start: int, rng: random.Random) -> List[int]:
+    '''
+    在社区内部的局部CSR上做教师机制采样，候选集用列表+位置字典维护，
+    每步O(1)地随机选取并交换删除，总代价与社区内边数成正比
+    @param indptr: 社区诱导子图的indptr（局部编号）
+    @param indices: 社区诱导子图的indices（局部编号）
+    @param start: 起始节点（局部编号）
+    @param rng: 随机数生成器
+    @return: 局部编号的walk
+    '''
+    visited = {start}
+    candidates, position = [], {}
+    walk = [start]
+    node = start
+    while True:
+        for v in indices[indptr[node]:indptr[node + 1]].tolist():
+            if v not in visited and v not in position:
+                position[v] = len(candidates)
+                candidates.append(v)
+        if not candidates:
+            return walk
+        i = rng.randrange(len(candidates))
+        node = candidates[i]
+        last = candidates.pop()
+        if last != node:
+            candidates[i] = last
+            position[last] = i
+        del position[node]
+        visited.add(node)
+        walk.append(node)
+
+
+class CommunityWalker:
+    '''
+    预先保存每个已知社区的诱导子图，之后的采样不再访问（可能被动态扩展的）图
+    '''
+
+    def __init__(self, graph: Graph, comms: List[List[int]]):
+        self.comms = [np.asarray(com, dtype=np.int64) for com in comms]
+        self.local_adj = [graph.induced_csr(nodes) for nodes in self.comms]
+
+    def __len__(self):
+        return len(self.comms)
+
+    def walk(self, i: int, rng: random.Random) -> List[int]:
+        nodes = self.comms[i]
+        indptr, indices = self.local_adj[i]
+        local = expansion_walk(indptr, indices, rng.randrange(len(nodes)), rng)
+        return nodes[local].tolist()
+
+    def sample_batch(self, bs: int, rng: random.Random):
+        '''
+        采样一个batch的训练数据
+        @param bs: batch大小
+        @param rng: 随机数生成器
+        @return: 强化学习的种子与真实社区，教师机制的walk
+        '''
+        n = len(self.comms)
+        rl_index = [rng.randrange(n) for _ in range(bs)]
+        rl_coms = [self.comms[i].tolist() for i in rl_index]
+        rl_seeds = [rng.choice(com) for com in rl_coms]
+        walks = [self.walk(rng.randrange(n), rng) for _ in range(bs)]
+        return rl_seeds, rl_coms, walks
+
+
+class TrainingSampler:
+    '''
+    后台线程预先生成训练batch，放入有界队列；prefetch为0时在调用处同步生成。
+    训练集变化时调用reset，旧训练集生成的batch会被丢弃；后台线程出错时由get抛出该异常
+    '''
+
+    def __init__(self, graph: Graph, comms: List[List[int]], bs: int, prefetch: int = 2,
+                 seed: Optional[int] = None):
+        self.graph = graph
+        self.bs = bs
+        self.prefetch = prefetch
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._queue = queue.Queue(maxsize=max(prefetch, 1))
+        self._thread = None
+        self._generation = 0
+        self._error = None
+        self._set_comms(comms, seed)
+        if prefetch > 0:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _set_comms(self, comms: List[List[int]], seed: Optional[int]):
+        walker = CommunityWalker(self.graph, comms)
+        # 随机种子取自主线程的random，保证结果可复现
+        rng = random.Random(random.getrandbits(64) if seed is None else seed)
+        with self._lock:
+            self._generation += 1
+            self._walker, self._rng = walker, rng
+
+    def reset(self, comms: List[List[int]], seed: Optional[int] = None):
+        '''
+        更换训练集
+        @param comms: 新的训练集
+        @param seed: 随机种子
+        '''
+        self._set_comms(comms, seed)
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._lock:
+                generation, walker, rng = self._generation, self._walker, self._rng
+            try:
+                batch = walker.sample_batch(self.bs, rng)
+            except Exception as e:
+                # 记录异常并放入标记，唤醒正在等待的get
+                self._error = e
+                self._put(None, None)
+                return
+            self._put(generation, batch)
+
+    def _put(self, generation: Optional[int], batch):
+        while not self._stop.is_set():
+            try:
+                self._queue.put((generation, batch), timeout=0.1)
+                return
+            except queue.Full:
+                if generation is not None and generation != self._generation:
+                    return
+
+    def get(self):
+        '''
+        @return: rl_seeds, rl_coms, walks
+        '''
+        if self._thread is None:
+            return self._walker.sample_batch(self.bs, self._rng)
+        while True:
+            if self._error is not None:
+                raise self._error
+            generation, batch = self._queue.get()
+            if generation == self._generation:
+                return batch
+
+    def close(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
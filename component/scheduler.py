@@ -0,0 +1,98 @@
+import copy
+import multiprocessing
+import os
+from typing import List, Tuple
+
+import torch
+
+from utils import seed_all, getseedsAndtruecom
+from .detector import Detector
+from .session import DatasetSession
+from .storage import load_csr_cache
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None
+
+_THREAD_ENV = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS')
+
+# 工作进程中的全局参数与已加载的数据集
+_WORKER_ARGS = None
+_WORKER_SESSIONS = {}
+
+
+def list_jobs(args, datasets: List[str]) -> List[Tuple[str, int, int, int]]:
+    '''
+    按数据集、种子的顺序列出所有任务
+    @param args: 全局参数
+    @param datasets: 数据集
+    @return: (dataset, 序号, 种子节点, 真实社区下标)
+    '''
+    jobs = []
+    for dataset in datasets:
+        seeds, com_indexs = getseedsAndtruecom(args, dataset)
+        for i in range(args.start, min(args.start + args.search_size, len(seeds))):
+            jobs.append((dataset, i, seeds[i], com_indexs[i]))
+    return jobs
+
+
+def _init_worker(args, threads: int):
+    global _WORKER_ARGS
+    torch.set_num_threads(threads)
+    if threadpool_limits is not None:
+        threadpool_limits(threads)
+    _WORKER_ARGS = args
+
+
+def _run_job(job: Tuple[str, int, int, int]):
+    '''
+    在工作进程中检测一个种子的社区；数据集在每个进程中只加载一次，图通过内存映射在进程间共享
+    '''
+    dataset, i, seed, com_index = job
+    args = copy.copy(_WORKER_ARGS)
+    args.dataset = dataset
+    # 工作进程不能再创建子进程，线程数已由_init_worker设置
+    args.rollout_workers = 0
+    args.threads = 0
+    if dataset not in _WORKER_SESSIONS:
+        _WORKER_SESSIONS.clear()
+        _WORKER_SESSIONS[dataset] = DatasetSession(args)
+    # 每个任务单独固定随机种子，结果与调度顺序无关
+    seed_all(args.seed)
+    print(f"正在处理_{dataset}_第{i}个节点", flush=True)
+    res = Detector(args, seed, com_index, _WORKER_SESSIONS[dataset]).detect()
+    return dataset, res
+
+
+def prepare_caches(args, datasets: List[str]):
+    '''
+    在主进程中预先构建CSR缓存与已知社区的kego子图缓存，工作进程只读
+    '''
+    for dataset in datasets:
+        load_csr_cache(args.root, dataset)
+        session_args = copy.copy(args)
+        session_args.dataset = dataset
+        DatasetSession(session_args)
+
+
+def schedule(args, datasets: List[str], writer, workers: int, threads: int = 1):
+    '''
+    将(dataset, seed)任务分给进程池执行，主进程按任务顺序写入结果
+    @param args: 全局参数
+    @param datasets: 数据集
+    @param writer: 写入结果的函数writer(args, res)
+    @param workers: 进程数
+    @param threads: 每个进程的torch/BLAS线程数
+    '''
+    jobs = list_jobs(args, datasets)
+    prepare_caches(args, datasets)
+    # spawn出的进程在导入numpy/torch前读取这些环境变量
+    for name in _THREAD_ENV:
+        os.environ.setdefault(name, str(threads))
+    ctx = multiprocessing.get_context('spawn')
+    with ctx.Pool(workers, initializer=_init_worker, initargs=(args, threads)) as pool:
+        # imap按任务顺序返回结果，写入顺序与串行执行一致
+        for dataset, res in pool.imap(_run_job, jobs):
+            args.dataset = dataset
+            writer(args, res)
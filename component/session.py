@@ -0,0 +1,94 @@
+from typing import List, Optional
+
+import numpy as np
+from scipy import sparse as sp
+from scipy.sparse.csgraph import connected_components
+
+from .graph import Graph, CSRGraph
+from .kernel import ShortestPathKernel
+from .storage import load_csr_cache, load_subgraph_cache, save_subgraph_cache
+
+
+def load_dataset(root: str, dataset: str, graph_backend: str = 'csr'):
+    '''
+    加载数据集
+    @param root: 根目录
+    @param dataset: 数据集名称
+    @param graph_backend: 图的存储方式
+    @return: 图，社区
+    '''
+    # 边文件只在第一次时解析，之后通过内存映射读取二进制CSR缓存
+    indptr, indices = load_csr_cache(root, dataset)
+    with open(f'{root}/{dataset}/{dataset}-1.90.cmty.txt') as fh:
+        comms = fh.read().strip().split('\n')
+        comms = [[int(i) for i in x.split()] for x in comms]
+    graph_cls = CSRGraph if graph_backend == 'csr' else Graph
+    graph = graph_cls.from_csr(indptr, indices)
+    return graph, comms
+
+
+def connected_communities(graph: Graph, communities: List[List[int]]) -> List[List[int]]:
+    '''
+    只保留在图中连通的社区
+    @param graph: 图
+    @param communities: 社区
+    '''
+    res = []
+    for com in communities:
+        indptr, indices = graph.induced_csr(np.unique(np.asarray(com, dtype=np.int64)))
+        sub_adj = sp.csr_matrix((np.ones(len(indices), dtype=bool), indices, indptr), shape=(len(indptr) - 1,) * 2)
+        n_components, _ = connected_components(sub_adj, directed=False)
+        if n_components == 1:
+            res.append(com)
+    return res
+
+
+class DatasetSession:
+    '''
+    一个数据集只加载一次：父图、社区、已知社区以及已知社区的kego子图，
+    同一数据集的所有种子共用，每个种子的Detector只需加入种子自身的kego
+    '''
+
+    def __init__(self, args, dataset: Optional[str] = None):
+        self.args = args
+        self.dataset = args.dataset if dataset is None else dataset
+        self.train_size = args.train_size
+        self.k_ego_subG = args.k_ego_subG
+        # 获取图、已知社区
+        self.graph, self.coms = load_dataset(args.root, self.dataset, args.graph_backend)
+        self.oldKnowcoms = self.coms[-args.train_size:]   # 后100
+        if self.dataset == "twitter":
+            self.oldKnowcoms = connected_communities(self.graph, self.oldKnowcoms)
+            print("len(communities_copy):", len(self.oldKnowcoms))
+
+        # 已知社区的k层邻居构成的子图，节点按旧编号从小到大重新编号
+        self.knowcomGraph, self.new_to_old = self.load_knowcom_graph(args.root)
+        self.knowcomGraph.setParentGraph(self.graph)
+        # 子图中原有节点的编号固定，已知社区的新编号可以直接复用
+        self.knowcoms = [Graph.map_old_to_new(self.new_to_old, com).tolist() for com in self.oldKnowcoms]
+        self._sp_kernel = None
+
+    @property
+    def sp_kernel(self) -> ShortestPathKernel:
+        '''
+        已知社区的最短路径核，第一次使用时计算，同一数据集的所有种子共用
+        '''
+        if self._sp_kernel is None:
+            self._sp_kernel = ShortestPathKernel(self.knowcomGraph.adj_mat, self.knowcoms)
+        return self._sp_kernel
+
+    def load_knowcom_graph(self, root: str):
+        '''
+        已知社区的kego子图只与(dataset, train_size, k_ego_subG)有关，优先读取磁盘缓存
+        @param root: 根目录
+        @return: 子图，new_to_old数组
+        '''
+        cached = load_subgraph_cache(root, self.dataset, self.train_size, self.k_ego_subG)
+        if cached is not None:
+            indptr, indices, new_to_old = cached
+            return type(self.graph).from_csr(indptr, indices), new_to_old
+        knowcom_nodes = set(node for com in self.coms[-self.train_size:] for node in com)
+        subgraph, new_to_old = self.graph.get_k_layer_subgraph(knowcom_nodes, self.k_ego_subG)
+        adj = subgraph.adj_mat
+        save_subgraph_cache(root, self.dataset, self.train_size, self.k_ego_subG, adj.indptr, adj.indices, new_to_old)
+        return subgraph, new_to_old
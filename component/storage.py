@@ -0,0 +1,172 @@
+import json
+import os
+import shutil
+import tempfile
+
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .graph import edges_to_csr
+
+
+def csr_cache_dir(root: str, dataset: str) -> str:
+    '''
+    二进制CSR缓存目录
+    @param root: 根目录
+    @param dataset: 数据集名称
+    '''
+    return f'{root}/{dataset}/{dataset}-1.90.csr'
+
+
+def _source_stamp(path: str) -> dict:
+    stat = os.stat(path)
+    return {'source': os.path.basename(path), 'size': stat.st_size, 'mtime': int(stat.st_mtime)}
+
+
+def _is_stale(meta_file: str, sources: List[str]) -> bool:
+    '''
+    缓存不存在，或任一源文件的大小、修改时间与记录不一致时视为过期
+    '''
+    if not os.path.exists(meta_file):
+        return True
+    with open(meta_file) as fh:
+        meta = json.load(fh)
+    stamps = meta.get('sources', [meta])
+    for path, stamp in zip(sources, stamps):
+        if os.path.exists(path) and any(stamp.get(k) != v for k, v in _source_stamp(path).items()):
+            return True
+    return False
+
+
+def _write_cache_dir(cache_dir: str, arrays: Dict[str, np.ndarray], meta: dict):
+    '''
+    先写入带版本的临时目录，再把cache_dir这个符号链接原子地指向它；读者解析路径时
+    只会看到旧版本或新版本，不会遇到目录不存在或半成品。不支持符号链接时先把旧目录改名移开再替换
+    '''
+    parent = os.path.dirname(cache_dir)
+    version_dir = tempfile.mkdtemp(prefix='.cache-', dir=parent)
+    for name, arr in arrays.items():
+        np.save(f'{version_dir}/{name}.npy', arr)
+    with open(f'{version_dir}/meta.json', 'w') as fh:
+        json.dump(meta, fh)
+
+    old_version = None
+    if os.path.islink(cache_dir):
+        old_version = os.path.join(parent, os.readlink(cache_dir))
+    elif os.path.isdir(cache_dir):
+        # 旧格式的普通目录，先改名移开
+        old_version = tempfile.mkdtemp(prefix='.cache-old-', dir=parent)
+        os.replace(cache_dir, old_version)
+    link = f'{version_dir}.link'
+    try:
+        os.symlink(os.path.basename(version_dir), link)
+        os.replace(link, cache_dir)
+    except (OSError, NotImplementedError):
+        if os.path.lexists(link):
+            os.remove(link)
+        try:
+            os.replace(version_dir, cache_dir)
+        except OSError:
+            # 其他进程已经写好了缓存
+            shutil.rmtree(version_dir, ignore_errors=True)
+    if old_version is not None and os.path.realpath(old_version) != os.path.realpath(cache_dir):
+        # 已打开的内存映射不受删除影响
+        shutil.rmtree(old_version, ignore_errors=True)
+
+
+def read_edge_file(path: str) -> np.ndarray:
+    '''
+    读取边文件，每行为"u v"
+    @param path: 边文件路径
+    @return: 形状为(E, 2)的边列表
+    '''
+    edges = np.fromfile(path, dtype=np.int64, sep=' ')
+    if len(edges) % 2 != 0:
+        raise ValueError(f'Malformed edge file: {path}')
+    return edges.reshape(-1, 2)
+
+
+def build_csr_cache(root: str, dataset: str) -> str:
+    '''
+    将边文件一次性转换为二进制CSR格式（indptr.npy、indices.npy、meta.json）
+    @param root: 根目录
+    @param dataset: 数据集名称
+    @return: 缓存目录
+    '''
+    edge_file = f'{root}/{dataset}/{dataset}-1.90.ungraph.txt'
+    cache_dir = csr_cache_dir(root, dataset)
+    indptr, indices = edges_to_csr(read_edge_file(edge_file))
+    if np.any(np.diff(indptr) == 0):
+        raise ValueError('Please re-label nodes first!')
+    meta = _source_stamp(edge_file)
+    meta.update({'n_nodes': len(indptr) - 1, 'nnz': len(indices), 'index_dtype': str(indices.dtype)})
+    _write_cache_dir(cache_dir, {'indptr': indptr, 'indices': indices}, meta)
+    return cache_dir
+
+
+def load_csr_cache(root: str, dataset: str, mmap_mode: str = 'r') -> (np.ndarray, np.ndarray):
+    '''
+    以内存映射方式打开CSR缓存，缓存不存在或已过期时先构建
+    @param root: 根目录
+    @param dataset: 数据集名称
+    @param mmap_mode: np.load的mmap_mode
+    @return: indptr, indices
+    '''
+    edge_file = f'{root}/{dataset}/{dataset}-1.90.ungraph.txt'
+    cache_dir = csr_cache_dir(root, dataset)
+    stale = _is_stale(f'{cache_dir}/meta.json', [edge_file])
+    if stale:
+        try:
+            build_csr_cache(root, dataset)
+        except OSError:
+            # 数据目录不可写时，直接在内存中构建
+            return edges_to_csr(read_edge_file(edge_file))
+    indptr = np.load(f'{cache_dir}/indptr.npy', mmap_mode=mmap_mode)
+    indices = np.load(f'{cache_dir}/indices.npy', mmap_mode=mmap_mode)
+    return indptr, indices
+
+
+def subgraph_cache_dir(root: str, dataset: str, train_size: int, k: int) -> str:
+    '''
+    已知社区kego子图的缓存目录
+    @param root: 根目录
+    @param dataset: 数据集名称
+    @param train_size: 已知社区数量
+    @param k: kego的层数
+    '''
+    return f'{root}/{dataset}/{dataset}-1.90.kego-{train_size}-{k}'
+
+
+def _subgraph_sources(root: str, dataset: str) -> List[str]:
+    return [f'{root}/{dataset}/{dataset}-1.90.ungraph.txt', f'{root}/{dataset}/{dataset}-1.90.cmty.txt']
+
+
+def save_subgraph_cache(root: str, dataset: str, train_size: int, k: int,
+                        indptr: np.ndarray, indices: np.ndarray, new_to_old: np.ndarray):
+    '''
+    保存已知社区kego子图（诱导子图的CSR与新旧编号映射），目录不可写时忽略
+    @param indptr: 子图CSR行指针
+    @param indices: 子图CSR列下标
+    @param new_to_old: 新编号i对应旧编号new_to_old[i]
+    '''
+    sources = _subgraph_sources(root, dataset)
+    meta = {'sources': [_source_stamp(path) for path in sources], 'train_size': train_size, 'k': k,
+            'n_nodes': len(new_to_old), 'nnz': len(indices)}
+    try:
+        _write_cache_dir(subgraph_cache_dir(root, dataset, train_size, k),
+                         {'indptr': indptr, 'indices': indices, 'new_to_old': new_to_old}, meta)
+    except OSError:
+        pass
+
+
+def load_subgraph_cache(root: str, dataset: str, train_size: int, k: int) -> Optional[tuple]:
+    '''
+    读取已知社区kego子图的缓存
+    @return: (indptr, indices, new_to_old)，缓存不存在或已过期时为None
+    '''
+    cache_dir = subgraph_cache_dir(root, dataset, train_size, k)
+    sources = _subgraph_sources(root, dataset)
+    if _is_stale(f'{cache_dir}/meta.json', sources):
+        return None
+    return tuple(np.load(f'{cache_dir}/{name}.npy') for name in ('indptr', 'indices', 'new_to_old'))
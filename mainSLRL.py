@@ -1,6 +1,8 @@
 import argparse
 import datetime
 from component.detector import Detector
+from component.scheduler import schedule
+from component.session import DatasetSession
 from utils import seed_all, getseedsAndtruecom, writerResToFile
 
 
@@ -11,10 +13,14 @@ def run(args):
     '''
     seeds, com_indexs = getseedsAndtruecom(args, args.dataset)
     print("search_size, args.start", len(seeds))
-    for i in range(1):
+    # 数据集只加载一次，各个种子共用
+    session = DatasetSession(args)
+    for i in range(args.start, min(args.start + args.search_size, len(seeds))):
         print(f"正在处理_{args.dataset}_第{i}个节点")
         seed, com_index = seeds[i], com_indexs[i]
-        detector = Detector(args, seed, com_index)
+        # 每个种子单独固定随机种子，与并行调度（component.scheduler）的结果一致
+        seed_all(args.seed)
+        detector = Detector(args, seed, com_index, session)
         res = detector.detect()
         writerResToFile(args, res)
 
@@ -25,20 +31,33 @@ if __name__ == '__main__':
     parser.add_argument('--seed', type=int, default=0)
     parser.add_argument('--train_size', type=int, default=100)
     parser.add_argument('--k_ego_subG', type=int, default=3)
+    parser.add_argument('--device', type=str, default='auto')     # auto、cpu或cuda:x
+    parser.add_argument('--threads', type=int, default=0)      # CPU上torch的线程数，0表示保持默认
+    parser.add_argument('--graph_backend', type=str, default='csr', choices=['csr', 'dict'])
 
     # Model
     parser.add_argument('--hidden_size', type=int, default=64)
     parser.add_argument('--g_lr', type=float, default=1e-2)
+    parser.add_argument('--propagation', type=str, default='matmul', choices=['matmul', 'push'])
+    parser.add_argument('--push_eps', type=float, default=1e-4)
+    parser.add_argument('--conv_cache', type=int, default=2000000)     # 传播结果缓存的非零元总数上限，0表示不缓存
+    parser.add_argument('--feature_store', type=str, default='sparse', choices=['sparse', 'dense'])
 
     # Train
     parser.add_argument('--g_batch_size', type=int, default=32)
     parser.add_argument('--epochs', type=int, default=100)
+    parser.add_argument('--rollout_workers', type=int, default=0)  # 并行采样轨迹的进程数，0表示在主进程中采样
+    parser.add_argument('--fused_step', type=int, default=0)   # 1表示强化学习与教师机制共用一次展开和一次参数更新
+    parser.add_argument('--prefetch', type=int, default=2)     # 后台预生成的训练batch数，0表示同步生成
+    parser.add_argument('--infer_batch_size', type=int, default=256)   # 生成社区时同时扩展的种子数
     parser.add_argument('--start', type=int, default=0)
     parser.add_argument('--search_size', type=int, default=1)
     parser.add_argument('--si', type=int, default=0.9)      # 测试相似度用
     parser.add_argument('--resfileName', type=str, default='sp_cluster')
     parser.add_argument('--ablation', type=int, default=0)
     parser.add_argument('--k', type=int, default=2)
+    parser.add_argument('--workers', type=int, default=0)      # 并行处理(dataset, seed)任务的进程数，0表示串行
+    parser.add_argument('--worker_threads', type=int, default=1)   # 每个进程的torch/BLAS线程数
 
 
     args = parser.parse_args()
@@ -50,9 +69,12 @@ if __name__ == '__main__':
 
     args.train_size = 100   # 训练集社区数量
     datasets = ['amazon', 'dblp', 'twitter', 'youtube', 'lj']
-    for dataset in datasets:
-        args.dataset = dataset
-        run(args)
+    if args.workers > 0:
+        schedule(args, datasets, writerResToFile, args.workers, args.worker_threads)
+    else:
+        for dataset in datasets:
+            args.dataset = dataset
+            run(args)
 
     print('## Finishing Time:', datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), flush=True)
     print('= ' * 20)
\ No newline at end of file